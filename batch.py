@@ -0,0 +1,193 @@
+"""
+Batch rewriting for Lexia
+
+Rewrites many snippets headlessly through the same engine, cache and rate
+limiter as the popup. Input is plain text (one snippet per line) or JSONL
+(one object per line with "text" and optional "id", "tone" and "model"), from
+a file or stdin. Results are written as JSONL in completion order as they
+finish, and each completed item's id is appended to a checkpoint file, so an
+interrupted run started again with the same input and output only rewrites
+what is left. Failed items are written with an "error" and retried on resume.
+
+Usage:
+    python main.py batch snippets.jsonl -o rewritten.jsonl --tone Professional --concurrency 8
+    cat macros.txt | python main.py batch - -o out.jsonl --tone "make it shorter"
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+from engine import get_engine
+from ratelimit import background_work
+from rewriter import rewrite_async
+
+DEFAULT_CONCURRENCY = 4
+CHECKPOINT_SUFFIX = ".checkpoint"
+# Seconds between progress lines on stderr
+PROGRESS_INTERVAL = 5.0
+# How long an interrupted run may take to wind down its in-flight rewrites (seconds)
+CANCEL_TIMEOUT = 10.0
+
+class BatchItem:
+    def __init__(self, item_id, text, tone=None, model=None):
+        self.id = item_id
+        self.text = text
+        self.tone = tone
+        self.model = model
+
+def read_items(lines, input_format="auto"):
+    """Parse input lines into BatchItems; ids default to the line number"""
+    items = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if input_format == "jsonl" or (input_format == "auto" and line.lstrip().startswith("{")):
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"line {line_number}: invalid JSON ({e})")
+            if not isinstance(record, dict) or not isinstance(record.get("text"), str):
+                raise ValueError(f"line {line_number}: expected an object with a \"text\" string")
+            items.append(BatchItem(str(record.get("id", line_number)), record["text"],
+                                   record.get("tone"), record.get("model")))
+        else:
+            items.append(BatchItem(str(line_number), line))
+    return items
+
+def load_checkpoint(path):
+    """Get the ids already completed by an earlier run"""
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path, "r", encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+async def run_batch(items, write_result, tone="Neutral", model=None, num_alternatives=1, concurrency=DEFAULT_CONCURRENCY,
+                    force_fresh=False, on_progress=None):
+    """Rewrite items with up to concurrency in flight, calling write_result(record) as each finishes.
+
+    Runs on the engine loop as background work, so interactive rewrites in the
+    same process go first. Returns totals for the throughput report.
+    """
+    background_work.set(True)
+    totals = {"items": 0, "failed": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+    pending = iter(items)
+
+    async def rewrite_item(item):
+        stats = {}
+        started = time.perf_counter()
+        alternatives = await rewrite_async(item.text, item.tone or tone, num_alternatives,
+                                           model_override=item.model or model, force_fresh=force_fresh, stats=stats)
+        record = {"id": item.id, "text": item.text, "tone": item.tone or tone, "model": stats.get("model"),
+                  "seconds": round(time.perf_counter() - started, 3)}
+        if alternatives and alternatives[0].startswith("Error:"):
+            record["error"] = alternatives[0][len("Error:"):].strip()
+            totals["failed"] += 1
+        else:
+            record.update(alternatives=alternatives, cached=stats.get("cached", False),
+                          usage=stats.get("usage"))
+            totals["cached"] += bool(stats.get("cached"))
+        for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            totals[field] += (stats.get("usage") or {}).get(field, 0)
+        totals["items"] += 1
+        write_result(record)
+        if on_progress:
+            on_progress(totals)
+
+    async def worker():
+        # Workers pull from a shared iterator so only `concurrency` items are ever in flight
+        for item in pending:
+            await rewrite_item(item)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return totals
+
+def format_throughput(totals, seconds):
+    seconds = max(seconds, 1e-9)
+    tokens = totals["prompt_tokens"] + totals["completion_tokens"]
+    return (f"{totals['items']} items in {seconds:.1f}s: {totals['items'] / seconds:.2f} items/s, "
+            f"{tokens / seconds:.0f} tokens/s ({totals['completion_tokens'] / seconds:.0f} completion tokens/s); "
+            f"{totals['failed']} failed, {totals['cached']} from cache; "
+            f"{totals['cached_tokens'] / max(totals['prompt_tokens'], 1):.0%} of prompt tokens cached by the provider")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="lexia batch", description="Rewrite snippets from a file or stdin")
+    parser.add_argument("input", help="text or JSONL file, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL file to append results to (default: stdout)")
+    parser.add_argument("--format", choices=["auto", "text", "jsonl"], default="auto",
+                        help="input format; auto treats lines starting with { as JSON")
+    parser.add_argument("--tone", default="Neutral", help="preset tone or a custom instruction")
+    parser.add_argument("--model", choices=["gpt-4", "llama-4-scout"], help="default: the model from settings")
+    parser.add_argument("-n", "--alternatives", type=int, default=1, help="alternatives per snippet")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="rewrites in flight at once")
+    parser.add_argument("--checkpoint", help=f"file of completed ids (default: OUTPUT{CHECKPOINT_SUFFIX})")
+    parser.add_argument("--fresh", action="store_true", help="skip the rewrite cache")
+    args = parser.parse_args(argv)
+
+    if args.input == "-":
+        items = read_items(sys.stdin, args.format)
+    else:
+        with open(args.input, "r", encoding="utf-8") as f:
+            items = read_items(f, args.format)
+    checkpoint_path = args.checkpoint or (args.output + CHECKPOINT_SUFFIX if args.output else None)
+    done = load_checkpoint(checkpoint_path)
+    remaining = [item for item in items if item.id not in done]
+    print(f"{len(items)} items, {len(items) - len(remaining)} already done, {len(remaining)} to rewrite",
+          file=sys.stderr)
+    if not remaining:
+        return 0
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    checkpoint = open(checkpoint_path, "a", encoding="utf-8") if checkpoint_path else None
+    last_progress = [time.perf_counter()]
+    started = time.perf_counter()
+
+    # Called on the engine thread, one item at a time
+    def write_result(record):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+        if checkpoint and "error" not in record:
+            # Only after the result is on disk: a crash in between redoes the item rather than losing it
+            checkpoint.write(record["id"] + "\n")
+            checkpoint.flush()
+
+    def report_progress(totals):
+        now = time.perf_counter()
+        if now - last_progress[0] >= PROGRESS_INTERVAL:
+            last_progress[0] = now
+            print(f"{totals['items']}/{len(remaining)} done", file=sys.stderr)
+
+    finished = threading.Event()
+
+    async def run():
+        try:
+            return await run_batch(remaining, write_result, args.tone, args.model, args.alternatives,
+                                   args.concurrency, args.fresh, report_progress)
+        finally:
+            finished.set()
+
+    future = get_engine().submit(run())
+    try:
+        totals = future.result()
+    except KeyboardInterrupt:
+        # The future reports cancelled at once, but the rewrites stop on the engine thread; wait for
+        # them so no result is written to a closed file or without its checkpoint line
+        future.cancel()
+        finished.wait(CANCEL_TIMEOUT)
+        print("Interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if checkpoint:
+            checkpoint.close()
+    print(format_throughput(totals, time.perf_counter() - started), file=sys.stderr)
+    return 1 if totals["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
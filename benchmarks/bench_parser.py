@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Parser micro-benchmark for Lexia's response formats
+
+Parses every response in a corpus (benchmarks/parser_corpus.jsonl by default)
+with the parsers in response_parser.py, both fed token by token as a stream
+and as one complete response, and with the regex cascade the rewriter used
+before, for comparison. Reports microseconds per response and throughput per
+format (json, separator, version), and how many responses did not yield the
+requested number of alternatives.
+
+The corpus is one JSON object per line: {"model", "structured",
+"alternatives", "content"}. Record real outputs into one with
+    LEXIA_RECORD_RESPONSES=responses.jsonl python main.py
+
+Usage:
+    python benchmarks/bench_parser.py --repeat 2000
+    python benchmarks/bench_parser.py --corpus responses.jsonl --json results.json
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import response_parser
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "parser_corpus.jsonl")
+_TOKEN_RE = re.compile(r'\s*\S+')
+
+def cascade_parse(content, model, num_alternatives):
+    """The pre-JSON parser: separator split, then Llama header regex, then blank-line split"""
+    alternatives = content.split(response_parser.ALTERNATIVE_SEPARATOR)
+    alternatives = [alt.strip() for alt in alternatives if alt.strip()]
+    if len(alternatives) < 2 and model == "llama-4-scout":
+        version_pattern = r'\*\*(?:Version|Alternative|Option)\s*\d+:.*?\*\*\s*(.*?)(?=\*\*(?:Version|Alternative|Option)\s*\d+:|$)'
+        matches = re.findall(version_pattern, content, re.DOTALL)
+        if matches:
+            alternatives = [match.strip() for match in matches]
+        else:
+            parts = content.split('\n\n')
+            alternatives = parts[:num_alternatives] if len(parts) >= num_alternatives else [content]
+    return alternatives
+
+def response_format(record):
+    if record["structured"]:
+        return "json"
+    return "version" if record["model"] == "llama-4-scout" else "separator"
+
+def load_corpus(paths):
+    records = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+def parse_stream(record, tokens):
+    parser = response_parser.make_parser(record["structured"])
+    for token in tokens:
+        parser.feed(token)
+    parser.finish()
+    return parser.completed
+
+def parse_full(record, tokens):
+    return response_parser.parse_alternatives(record["content"], record["structured"])
+
+def parse_cascade(record, tokens):
+    return cascade_parse(record["content"], record["model"], record["alternatives"])
+
+PARSERS = {"stream": parse_stream, "full": parse_full, "cascade": parse_cascade}
+
+def run(records, repeat):
+    """Per (format, parser): responses parsed, seconds, characters, and responses with the wrong count"""
+    results = {}
+    for record in records:
+        tokens = _TOKEN_RE.findall(record["content"])
+        for name, parse in PARSERS.items():
+            if name == "cascade" and record["structured"]:
+                # The cascade never handled JSON
+                continue
+            alternatives = parse(record, tokens)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                parse(record, tokens)
+            elapsed = time.perf_counter() - started
+            row = results.setdefault(f"{response_format(record)}/{name}",
+                                     {"responses": 0, "seconds": 0.0, "chars": 0, "miscounted": 0})
+            row["responses"] += repeat
+            row["seconds"] += elapsed
+            row["chars"] += len(record["content"]) * repeat
+            row["miscounted"] += len(alternatives) != record["alternatives"]
+    return results
+
+def print_report(results, corpus_size):
+    print(f"Lexia parser benchmark: {corpus_size} responses")
+    print(f"{'format/parser':<20}{'us/response':>14}{'MB/s':>10}{'miscounted':>12}")
+    for key in sorted(results):
+        row = results[key]
+        per_response = row["seconds"] / row["responses"] * 1e6
+        throughput = row["chars"] / row["seconds"] / 1e6 if row["seconds"] else 0.0
+        print(f"{key:<20}{per_response:>14.2f}{throughput:>10.1f}{row['miscounted']:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Lexia's response parsers on recorded outputs")
+    parser.add_argument("--corpus", action="append", help=f"corpus file (repeatable; default {DEFAULT_CORPUS})")
+    parser.add_argument("--repeat", type=int, default=500, help="parses per response and parser")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    records = load_corpus(args.corpus or [DEFAULT_CORPUS])
+    results = run(records, args.repeat)
+    print_report(results, len(records))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
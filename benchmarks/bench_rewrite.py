@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+End-to-end latency benchmark for Lexia's rewrite path
+
+Starts the local fake OpenAI server, points the rewriter at it with throwaway
+settings and cache files, drives rewrites through the same code the popup
+uses, and reports p50/p95/p99 for each stage:
+
+    settings_parse   cold parse + key decode of settings.json
+    settings_load    hot-path settings snapshot
+    client_setup     cold creation of a pooled API client
+    client_lookup    warm lookup of the pooled client
+    ttfb             request start to first streamed text
+    completion       request start to final alternatives
+    parse_stream     incremental parsing of a recorded response
+    parse_full       parsing of a complete recorded response
+
+Usage:
+    python benchmarks/bench_rewrite.py --iterations 50 --ttfb 0.1 --token-rate 200
+    python benchmarks/bench_rewrite.py --json results.json
+    python benchmarks/bench_rewrite.py --baseline results.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_openai_server import FakeServerConfig, start_server, build_response_text
+
+STAGES = ["settings_parse", "settings_load", "client_setup", "client_lookup", "ttfb", "completion",
+          "parse_stream", "parse_full"]
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(timings):
+    """p50/p95/p99 in milliseconds per stage"""
+    summary = {}
+    for stage in STAGES:
+        samples = timings.get(stage, [])
+        if samples:
+            summary[stage] = {"count": len(samples),
+                              "p50": percentile(samples, 0.50) * 1000,
+                              "p95": percentile(samples, 0.95) * 1000,
+                              "p99": percentile(samples, 0.99) * 1000}
+    return summary
+
+def configure_environment(workdir, base_url, model):
+    """Point settings, cache and clients at throwaway files and the fake server"""
+    import settings
+    import rewrite_cache
+    import rewriter
+
+    settings.SETTINGS_FILE = os.path.join(workdir, "settings.json")
+    rewrite_cache.CACHE_FILE = os.path.join(workdir, "rewrite_cache.db")
+    bench_settings = settings.load_settings()
+    bench_settings.update({"openai_api_key": "sk-benchmark-key", "groq_api_key": "gsk-benchmark-key",
+                           "model": model, "cache_enabled": False, "stream_responses": True,
+                           "generation_mode": "combined", "hedge_requests": False})
+    settings.save_settings(bench_settings)
+    for provider in rewriter.PROVIDER_BASE_URLS:
+        rewriter.PROVIDER_BASE_URLS[provider] = base_url
+    rewriter.invalidate_clients()
+
+def run(args):
+    import settings
+    import rewriter
+    import prompts
+    import response_parser
+
+    provider = rewriter._provider_for(args.model)
+    # Cold client creation is measured on the provider not under test, so the
+    # rewrites below keep a warm connection pool like the real hot path
+    spare_provider = "groq" if provider == "openai" else "openai"
+    timings = {stage: [] for stage in STAGES}
+    errors = 0
+    # The rewrites below are streamed, which never uses JSON mode
+    structured = args.format == "json"
+    recorded = build_response_text(
+        prompts.build_messages(args.text, "Neutral", args.alternatives, args.model, structured),
+        FakeServerConfig(response_format=args.format), structured)
+
+    for iteration in range(args.warmup + args.iterations):
+        measuring = iteration >= args.warmup
+
+        started = time.perf_counter()
+        settings._read_settings_file()
+        settings_parse = time.perf_counter() - started
+
+        started = time.perf_counter()
+        settings.get_settings()
+        settings_load = time.perf_counter() - started
+
+        rewriter.invalidate_clients([spare_provider])
+        started = time.perf_counter()
+        rewriter.get_client(spare_provider)
+        client_setup = time.perf_counter() - started
+
+        started = time.perf_counter()
+        rewriter.get_client(provider)
+        client_lookup = time.perf_counter() - started
+
+        first_text = []
+        request_started = time.perf_counter()
+        alternatives = rewriter.rewrite_text_with_gpt(
+            args.text, "Neutral", num_alternatives=args.alternatives, model_override=args.model,
+            on_text=lambda index, text: first_text or first_text.append(time.perf_counter()))
+        completion = time.perf_counter() - request_started
+        if alternatives and alternatives[0].startswith("Error:"):
+            errors += 1
+            continue
+
+        started = time.perf_counter()
+        parser = response_parser.make_parser(structured)
+        for token in recorded.split(" "):
+            parser.feed(token + " ")
+        parser.finish()
+        parse_stream = time.perf_counter() - started
+
+        started = time.perf_counter()
+        response_parser.parse_alternatives(recorded, structured)
+        parse_full = time.perf_counter() - started
+
+        if measuring:
+            timings["settings_parse"].append(settings_parse)
+            timings["settings_load"].append(settings_load)
+            timings["client_setup"].append(client_setup)
+            timings["client_lookup"].append(client_lookup)
+            if first_text:
+                timings["ttfb"].append(first_text[0] - request_started)
+            timings["completion"].append(completion)
+            timings["parse_stream"].append(parse_stream)
+            timings["parse_full"].append(parse_full)
+
+    return timings, errors
+
+def print_report(summary, errors, args, connections, prompt_cache):
+    print(f"Lexia rewrite benchmark: model={args.model} alternatives={args.alternatives} "
+          f"ttfb={args.ttfb}s token_rate={args.token_rate}/s error_rate={args.error_rate} format={args.format}")
+    print(f"{'stage':<16}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}")
+    for stage, row in summary.items():
+        print(f"{stage:<16}{row['count']:>6}{row['p50']:>12.3f}{row['p95']:>12.3f}{row['p99']:>12.3f}")
+    print(f"errors: {errors}   connections: {connections['opened']} opened, {connections['reused']} reused")
+    for provider, counts in prompt_cache.items():
+        if counts["responses"]:
+            print(f"prompt cache ({provider}): {counts['cached_tokens']} of {counts['prompt_tokens']} prompt tokens "
+                  f"cached ({counts['ratio']:.0%})")
+
+def compare(summary, baseline, tolerance, min_delta_ms):
+    """List stages whose p95 regressed beyond the tolerance (and by more than timer noise)"""
+    regressions = []
+    for stage, row in summary.items():
+        before = baseline.get(stage)
+        if (before and row["p95"] > before["p95"] * (1 + tolerance)
+                and row["p95"] - before["p95"] > min_delta_ms):
+            regressions.append(f"{stage}: p95 {before['p95']:.3f} ms -> {row['p95']:.3f} ms")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Lexia's rewrite path against a local fake server")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--model", choices=["gpt-4", "llama-4-scout"], default="gpt-4")
+    parser.add_argument("--alternatives", type=int, default=3)
+    parser.add_argument("--text", default="hey can u send me the report by tmrw, i need it for the meeting thx")
+    parser.add_argument("--ttfb", type=float, default=0.05, help="fake server seconds before the first byte")
+    parser.add_argument("--token-rate", type=float, default=400.0, help="fake server tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--format", choices=["auto", "separator", "version", "json"], default="auto")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prompt prefix the fake server reports as cached")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--baseline", help="compare p95s against a summary written with --json")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 regression vs. the baseline")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0,
+                        help="ignore p95 regressions smaller than this many milliseconds")
+    args = parser.parse_args()
+
+    config = FakeServerConfig(args.ttfb, args.token_rate, args.error_rate, args.format,
+                              cache_min_tokens=args.cache_min_tokens)
+    server = start_server(config)
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, f"http://127.0.0.1:{server.server_port}/v1", args.model)
+        import rewriter
+        timings, errors = run(args)
+        summary = summarize(timings)
+        print_report(summary, errors, args, rewriter.get_connection_stats(), rewriter.get_prompt_cache_stats())
+        rewriter.invalidate_clients()
+    server.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(summary, json.load(f), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print("Regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
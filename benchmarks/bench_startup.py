@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for Lexia
+
+Reports an import-time breakdown of main.py (python -X importtime) and the
+time until the hotkey is registered, measured by launching main.py in a
+throwaway directory with LEXIA_STARTUP_PROBE set so it exits once the
+background warm-up has finished. Fails (exit 1) when a budget is exceeded or
+a module that should load lazily is imported eagerly again.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --hotkey-budget-ms 400 --import-budget-ms 250
+    python benchmarks/bench_startup.py --json startup.json
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Heavy modules that must only load after the hotkey is live
+LAZY_MODULES = ["openai", "httpx", "pydantic", "pyautogui", "pyperclip", "pystray", "PIL", "tkinter",
+                "ui_enhanced", "rewriter", "clipboard"]
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+_PROBE_RE = re.compile(r'startup: hotkey_registered_ms=([\d.]+) warm_ms=([\d.]+) popup_ready=(\w+)')
+
+def parse_importtime(stderr):
+    """Get (module, depth, self_us, cumulative_us) for each line of -X importtime output"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, (len(indent) - 1) // 2, int(self_us), int(cumulative_us)))
+    return entries
+
+def import_breakdown():
+    """Import main.py once with -X importtime and summarize what it pulled in"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr.strip().splitlines()[-1]}")
+    entries = parse_importtime(result.stderr)
+    main_index = max(index for index, entry in enumerate(entries) if entry[0] == "main")
+    main_entry = entries[main_index]
+    # -X importtime lists a module's imports (deeper) right before the module itself
+    first_child = main_index
+    while first_child > 0 and entries[first_child - 1][1] > main_entry[1]:
+        first_child -= 1
+    children = entries[first_child:main_index]
+    direct = [entry for entry in children if entry[1] == main_entry[1] + 1]
+    imported = {entry[0] for entry in children}
+    eager = sorted(module for module in LAZY_MODULES
+                   if module in imported or any(name.startswith(module + ".") for name in imported))
+    return {"total_ms": main_entry[3] / 1000,
+            "modules": sorted(((module, cumulative / 1000) for module, _, _, cumulative in direct),
+                              key=lambda item: -item[1]),
+            "eager_lazy_modules": eager}
+
+def prepare_workdir(workdir):
+    """Settings with placeholder keys so main.py skips the first-run window"""
+    import settings
+    settings.SETTINGS_FILE = os.path.join(workdir, "settings.json")
+    probe_settings = settings.load_settings()
+    # No daemon, so a running Lexia neither blocks the probe nor gets its client file overwritten
+    probe_settings.update({"openai_api_key": "sk-benchmark-key", "groq_api_key": "gsk-benchmark-key",
+                           "daemon_enabled": False})
+    settings.save_settings(probe_settings)
+
+def probe_startup(workdir):
+    """Launch main.py until its warm-up is done; get wall-clock and in-process timings in ms"""
+    # Its own instance lock, so a running Lexia doesn't stop the probe
+    env = dict(os.environ, LEXIA_STARTUP_PROBE="1", LEXIA_INSTANCE_LOCK=os.path.join(workdir, "lexia.lock"))
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, "main.py")], cwd=workdir, env=env,
+                            capture_output=True, text=True, timeout=120)
+    wall_ms = (time.perf_counter() - started) * 1000
+    match = _PROBE_RE.search(result.stdout)
+    if not match:
+        raise RuntimeError(f"main.py did not report startup timings (exit {result.returncode}):\n"
+                           f"{(result.stdout + result.stderr).strip()}")
+    return {"hotkey_registered_ms": float(match.group(1)), "warm_ms": float(match.group(2)),
+            "popup_ready": match.group(3) == "True", "wall_ms": wall_ms}
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Lexia's startup path")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--hotkey-budget-ms", type=float, default=400.0,
+                        help="maximum median time from main.py start to hotkey registered")
+    parser.add_argument("--import-budget-ms", type=float, default=250.0,
+                        help="maximum cumulative import time of main.py")
+    parser.add_argument("--top", type=int, default=10, help="number of direct imports to list")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    failures = []
+    imports = import_breakdown()
+    print(f"import main: {imports['total_ms']:.1f} ms cumulative")
+    for module, cumulative_ms in imports["modules"][:args.top]:
+        print(f"  {module:<24}{cumulative_ms:>10.1f} ms")
+    if imports["eager_lazy_modules"]:
+        failures.append("imported eagerly by main.py: " + ", ".join(imports["eager_lazy_modules"]))
+    if imports["total_ms"] > args.import_budget_ms:
+        failures.append(f"import main took {imports['total_ms']:.1f} ms (budget {args.import_budget_ms:.0f} ms)")
+
+    runs = []
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workdir(workdir)
+        for _ in range(args.runs):
+            runs.append(probe_startup(workdir))
+    summary = {key: median([run[key] for run in runs]) for key in ("hotkey_registered_ms", "warm_ms", "wall_ms")}
+    print(f"hotkey registered: {summary['hotkey_registered_ms']:.1f} ms (median of {len(runs)})")
+    print(f"warm-up finished:  {summary['warm_ms']:.1f} ms")
+    print(f"process wall time: {summary['wall_ms']:.1f} ms")
+    if not all(run["popup_ready"] for run in runs):
+        print("warning: the popup could not be built (no display?); warm-up time excludes it")
+    if summary["hotkey_registered_ms"] > args.hotkey_budget_ms:
+        failures.append(f"hotkey registered after {summary['hotkey_registered_ms']:.1f} ms "
+                        f"(budget {args.hotkey_budget_ms:.0f} ms)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"imports": imports, "startup": summary, "runs": runs}, f, indent=2)
+    if failures:
+        print("Budget exceeded:")
+        for line in failures:
+            print(f"  {line}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
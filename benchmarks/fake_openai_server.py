@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Local OpenAI-compatible stub server for Lexia benchmarks
+
+Serves /v1/chat/completions (streaming and non-streaming, including `n`) with
+configurable time-to-first-byte, token rate and error rate, and replies in
+any of the formats Lexia has to parse: '---ALTERNATIVE---' separators (GPT),
+'**Version N:**' headers (Llama) or a JSON object when the request sets
+response_format (refused on streamed requests, as Groq does). Prompt caching
+is simulated the way OpenAI reports it: a prompt sharing at least
+cache_min_tokens of prefix with a recent one reports the shared part, in
+128-token steps, as prompt_tokens_details.cached_tokens.
+No network access or API key is needed.
+
+Run standalone to point a development copy of Lexia at it:
+    python benchmarks/fake_openai_server.py --port 8999 --ttfb 0.3 --token-rate 80
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SAMPLE_SENTENCES = [
+    "Thanks for the update on the release schedule.",
+    "I have reviewed the proposal and left a few comments for the team.",
+    "Could you please confirm the meeting time for Thursday afternoon?",
+    "The new build fixes the crash that several customers reported last week.",
+    "Let me know if anything else is needed before we ship.",
+]
+
+_ALTERNATIVE_COUNT_RE = re.compile(r'in (\d+) different ways')
+
+CACHE_STEP_TOKENS = 128
+RECENT_PROMPTS = 32
+
+class FakeServerConfig:
+    def __init__(self, ttfb=0.2, token_rate=100.0, error_rate=0.0, response_format="auto", sentences=2,
+                 cache_min_tokens=1024):
+        self.ttfb = ttfb
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        # "separator", "version", "json", or "auto" (pick by the request, like the real models)
+        self.response_format = response_format
+        self.sentences = sentences
+        self.cache_min_tokens = cache_min_tokens
+        self.recent_prompts = deque(maxlen=RECENT_PROMPTS)
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+def _alternative_text(index, sentences):
+    return " ".join(SAMPLE_SENTENCES[(index + i) % len(SAMPLE_SENTENCES)] for i in range(sentences))
+
+def build_response_text(messages, config, json_mode=False):
+    """Build a reply in the format the prompt (or JSON mode) asked for"""
+    prompt = "\n".join(message.get("content", "") for message in messages)
+    match = _ALTERNATIVE_COUNT_RE.search(prompt)
+    count = int(match.group(1)) if match else 1
+    response_format = config.response_format
+    if response_format == "auto":
+        response_format = "json" if json_mode else "version" if "'Version 1:'" in prompt else "separator"
+
+    alternatives = [_alternative_text(i, config.sentences) for i in range(count)]
+    if response_format == "json":
+        return json.dumps({"alternatives": alternatives}, ensure_ascii=False)
+    if count == 1:
+        return alternatives[0]
+    if response_format == "version":
+        parts = [f"Here are {count} rewritten versions:"]
+        parts += [f"**Version {i + 1}:**\n{alt}" for i, alt in enumerate(alternatives)]
+        return "\n\n".join(parts)
+    return "\n---ALTERNATIVE---\n".join(alternatives)
+
+def tokenize(text):
+    """Split text into word-sized pieces that stand in for tokens"""
+    return re.findall(r'\s*\S+', text)
+
+def cached_prefix_tokens(prompt_tokens, config):
+    """Tokens of prompt_tokens a provider would serve from its prompt cache, remembering this prompt"""
+    with config.lock:
+        shared = 0
+        for previous in config.recent_prompts:
+            length = 0
+            for a, b in zip(previous, prompt_tokens):
+                if a != b:
+                    break
+                length += 1
+            shared = max(shared, length)
+        config.recent_prompts.append(prompt_tokens)
+    if shared < config.cache_min_tokens:
+        return 0
+    return shared // CACHE_STEP_TOKENS * CACHE_STEP_TOKENS
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        config = self.config
+        with config.lock:
+            config.requests += 1
+            failed = random.random() < config.error_rate
+            if failed:
+                config.errors += 1
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        if failed:
+            self._send_json(429, {"error": {"message": "Rate limit reached (simulated)", "type": "rate_limit"}},
+                            {"Retry-After": "0"})
+            return
+
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        if json_mode and body.get("stream"):
+            # Like Groq, JSON mode can't be streamed
+            self._send_json(400, {"error": {"message": "response_format json_object does not support streaming "
+                                                       "(simulated)",
+                                            "type": "invalid_request_error", "param": "response_format"}})
+            return
+
+        time.sleep(config.ttfb)
+        n = body.get("n", 1)
+        texts = [build_response_text(body.get("messages", []), config, json_mode) for _ in range(n)]
+        model = body.get("model", "fake-model")
+        prompt = [token for m in body.get("messages", []) for token in [m.get("role", "")] + tokenize(m.get("content", ""))]
+        prompt_tokens = len(prompt)
+        completion_tokens = sum(len(tokenize(text)) for text in texts)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens,
+                 "prompt_tokens_details": {"cached_tokens": cached_prefix_tokens(prompt, config)}}
+
+        if not body.get("stream"):
+            time.sleep(completion_tokens / config.token_rate if config.token_rate else 0)
+            self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+                            for i, text in enumerate(texts)],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        interval = 1.0 / config.token_rate if config.token_rate else 0
+        next_at = time.perf_counter()
+        token_lists = [tokenize(text) for text in texts]
+        for position in range(max(len(tokens) for tokens in token_lists) + 1):
+            for index, tokens in enumerate(token_lists):
+                if position > len(tokens):
+                    continue
+                finished = position == len(tokens)
+                delta = {} if finished else {"content": tokens[position]}
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model,
+                         "choices": [{"index": index, "delta": delta, "finish_reason": "stop" if finished else None}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            next_at += interval
+            # Sleep in aggregate so high token rates aren't limited by timer resolution
+            delay = next_at - time.perf_counter()
+            if delay > 0.001:
+                time.sleep(delay)
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [], "usage": usage}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+def start_server(config, host="127.0.0.1", port=0):
+    """Start the stub server in a background thread and return it"""
+    handler = type("ConfiguredFakeOpenAIHandler", (FakeOpenAIHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--ttfb", type=float, default=0.2, help="seconds before the first byte")
+    parser.add_argument("--token-rate", type=float, default=100.0, help="tokens per second")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--format", choices=["auto", "separator", "version", "json"], default="auto")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024,
+                        help="shortest prompt prefix reported as cached")
+    args = parser.parse_args()
+
+    config = FakeServerConfig(args.ttfb, args.token_rate, args.error_rate, args.format,
+                              cache_min_tokens=args.cache_min_tokens)
+    server = start_server(config, args.host, args.port)
+    print(f"Fake OpenAI server listening on http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -75,7 +75,7 @@ def test_executable():
         return False
     
     try:
-        # Just check if it can start (will exit quickly due to lock file check)
+        # Just check if it can start (exits quickly if another instance is running)
         result = subprocess.run([str(exe_path)], 
                               timeout=5, 
                               capture_output=True, 
@@ -0,0 +1,97 @@
+"""
+Long-text chunking for Lexia
+
+Splits a long selection into chunks of at most a given number of tokens,
+breaking on paragraph boundaries first, then sentences, then words, so each
+chunk can be rewritten on its own and the results stitched back together.
+Chunks are contiguous slices of the original; the whitespace around each one
+is kept aside and put back when stitching, so paragraph breaks and
+indentation survive the rewrite.
+"""
+
+import re
+from tokens import count_tokens
+
+_PARAGRAPH_BREAK_RE = re.compile(r'\n[ \t]*\n\s*')
+_SENTENCE_END_RE = re.compile(r'(?<=[.!?。！？])["\')\]]*\s+')
+_WORD_BREAK_RE = re.compile(r'\s+')
+
+def estimate_tokens(text):
+    """Token count used for chunk budgets"""
+    return count_tokens(text)
+
+class Chunk:
+    def __init__(self, lead, text, trail):
+        self.lead = lead
+        self.text = text
+        self.trail = trail
+
+def _pieces(text, start, end, pattern):
+    """Split text[start:end] after each match of pattern, as (start, end) spans covering it exactly"""
+    spans = []
+    piece_start = start
+    for match in pattern.finditer(text, start, end):
+        if match.end() < end:
+            spans.append((piece_start, match.end()))
+            piece_start = match.end()
+    spans.append((piece_start, end))
+    return spans
+
+def _split_span(text, start, end, max_tokens, patterns):
+    """Split a span into spans of at most max_tokens, using the coarsest boundaries that work"""
+    if estimate_tokens(text[start:end]) <= max_tokens:
+        return [(start, end)]
+    if not patterns:
+        # A single run with no usable boundary: cut it by length
+        spans = []
+        position = start
+        while position < end:
+            cut = min(end, position + max(1, max_tokens * 4 - 1))
+            while cut - position > 1 and estimate_tokens(text[position:cut]) > max_tokens:
+                cut = position + (cut - position) * 3 // 4
+            spans.append((position, cut))
+            position = cut
+        return spans
+
+    spans = []
+    current_start = None
+    current_end = None
+    for piece_start, piece_end in _pieces(text, start, end, patterns[0]):
+        if current_start is not None and estimate_tokens(text[current_start:piece_end]) <= max_tokens:
+            current_end = piece_end
+            continue
+        if current_start is not None:
+            spans.append((current_start, current_end))
+        if estimate_tokens(text[piece_start:piece_end]) <= max_tokens:
+            current_start, current_end = piece_start, piece_end
+        else:
+            spans.extend(_split_span(text, piece_start, piece_end, max_tokens, patterns[1:]))
+            current_start = current_end = None
+    if current_start is not None:
+        spans.append((current_start, current_end))
+    return spans
+
+def split_into_chunks(text, max_tokens):
+    """Split text into Chunks of at most max_tokens, on paragraph, then sentence, then word boundaries"""
+    spans = _split_span(text, 0, len(text), max_tokens, [_PARAGRAPH_BREAK_RE, _SENTENCE_END_RE, _WORD_BREAK_RE])
+    chunks = []
+    for start, end in spans:
+        piece = text[start:end]
+        stripped = piece.strip()
+        if not stripped:
+            # Pure whitespace (only possible at the edges); fold it into a neighbour
+            if chunks:
+                chunks[-1].trail += piece
+            else:
+                chunks.append(Chunk(piece, "", ""))
+            continue
+        lead_length = len(piece) - len(piece.lstrip())
+        chunks.append(Chunk(piece[:lead_length], stripped, piece[lead_length + len(stripped):]))
+    if chunks and not chunks[0].text and len(chunks) > 1:
+        leading = chunks.pop(0)
+        chunks[0].lead = leading.lead + chunks[0].lead
+    return chunks
+
+def stitch(chunks, rewritten):
+    """Join rewritten chunk texts back together with the original surrounding whitespace"""
+    return "".join(chunk.lead + text + chunk.trail for chunk, text in zip(chunks, rewritten))
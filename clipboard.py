@@ -0,0 +1,99 @@
+"""
+Selection capture for Lexia
+
+Copies the selected text by sending Ctrl+C and waits for the clipboard to
+actually change instead of sleeping a fixed time: on Windows by watching the
+clipboard sequence number, elsewhere by planting a sentinel and polling until
+it is replaced. The wait times out after a few multiples of recent capture
+times, and the user's previous clipboard text is put back afterwards.
+
+pyperclip only sees text, so an image or files on the clipboard read as "".
+No sentinel is planted over those (or over an empty clipboard); the capture
+then waits for any text to appear. As with any Ctrl+C, copying a selection
+replaces them; if nothing is copied they are left untouched.
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+import pyautogui
+import pyperclip
+
+CAPTURE_DEFAULT_TIMEOUT = 0.5
+CAPTURE_MIN_TIMEOUT = 0.15
+CAPTURE_MAX_TIMEOUT = 1.5
+CAPTURE_POLL_INTERVAL = 0.01
+CAPTURE_HISTORY = 20
+
+_capture_times = deque(maxlen=CAPTURE_HISTORY)
+_capture_lock = threading.Lock()
+
+def _clipboard_sequence_number():
+    """Windows' clipboard change counter, or None where it isn't available"""
+    try:
+        import ctypes
+        return ctypes.windll.user32.GetClipboardSequenceNumber() or None
+    except (AttributeError, OSError):
+        return None
+
+def capture_timeout():
+    """How long to wait for the copy to land, learned from recent captures"""
+    with _capture_lock:
+        recent = list(_capture_times)
+    if len(recent) < 3:
+        return CAPTURE_DEFAULT_TIMEOUT
+    return min(CAPTURE_MAX_TIMEOUT, max(CAPTURE_MIN_TIMEOUT, 3 * max(recent)))
+
+def _paste():
+    try:
+        return pyperclip.paste()
+    except pyperclip.PyperclipException as e:
+        print(f"Error reading clipboard: {e}")
+        return None
+
+def capture_selection():
+    """Copy the current selection and return it, or "" if nothing was copied in time"""
+    previous = _paste()
+    sequence = _clipboard_sequence_number()
+    sentinel = None
+    if sequence is None and previous:
+        # Only over text: planting it would wipe non-text contents, which read as ""
+        sentinel = f"lexia-capture-{uuid.uuid4().hex}"
+        pyperclip.copy(sentinel)
+
+    # pyautogui.hotkey() would otherwise sleep pyautogui.PAUSE after the keystrokes
+    pause = pyautogui.PAUSE
+    pyautogui.PAUSE = 0
+    try:
+        started = time.perf_counter()
+        pyautogui.hotkey('ctrl', 'c')
+    finally:
+        pyautogui.PAUSE = pause
+
+    deadline = started + capture_timeout()
+    text = None
+    while True:
+        if sequence is not None:
+            if _clipboard_sequence_number() != sequence:
+                text = _paste()
+        else:
+            current = _paste()
+            # Without a sentinel the clipboard held no text, so any text is the copy
+            if current and current != sentinel:
+                text = current
+        if text is not None or time.perf_counter() >= deadline:
+            break
+        time.sleep(CAPTURE_POLL_INTERVAL)
+
+    if text is not None:
+        with _capture_lock:
+            _capture_times.append(time.perf_counter() - started)
+    else:
+        print("Timed out waiting for the selection to be copied")
+
+    # Put back the text the user had copied before. Without it there was no sentinel,
+    # so the clipboard holds the copied selection or is as the user left it.
+    if previous:
+        pyperclip.copy(previous)
+    return text or ""
@@ -0,0 +1,282 @@
+"""
+Local rewrite daemon for Lexia
+
+Serves rewrite, stream and batch requests from other tools over a localhost
+TCP port, on the same engine loop as the popup, so every caller shares one
+warm client pool, rewrite cache and rate limiter. The protocol and a
+standard-library client are in lexia_client.py.
+
+Only one Lexia runs per user: main.py and the headless daemon take an OS
+lock on ~/.lexia.lock before anything else, whether or not the daemon is
+enabled. Unlike the old PID file, the lock disappears with the process
+however it exits. The daemon starts serving (and publishes its address) as
+soon as warm-up begins, so a second launch can ping it.
+
+Usage:
+    python main.py daemon            # headless, no hotkey or tray
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import socket
+import sys
+
+from engine import get_engine
+from lexia_client import daemon_file_path, LexiaClient, DaemonUnavailable
+
+DEFAULT_PORT = 47321
+HOST = "127.0.0.1"
+MODELS = ("gpt-4", "llama-4-scout")
+MAX_BATCH_CONCURRENCY = 16
+# Longest request line accepted (a batch carries all its items)
+MAX_LINE_BYTES = 64 * 1024 * 1024
+# Set to use another single-instance lock file, e.g. to benchmark beside a running Lexia
+INSTANCE_LOCK_ENV = "LEXIA_INSTANCE_LOCK"
+
+def instance_lock_path():
+    return os.environ.get(INSTANCE_LOCK_ENV) or os.path.join(os.path.expanduser("~"), ".lexia.lock")
+
+def claim_instance_lock():
+    """Take the single-instance lock; returns the open lock file to keep, or None if another Lexia holds it"""
+    lock_file = open(instance_lock_path(), "a+", encoding="utf-8")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    # For the curious; the lock itself is what counts
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+def claim_port(port=DEFAULT_PORT):
+    """Bind the daemon's port; raises OSError if another instance (or program) holds it"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        if os.name != "nt":
+            # Lets a restart bind while old connections sit in TIME_WAIT. Not on
+            # Windows, where it would let two processes bind the same port.
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((HOST, port))
+        sock.listen()
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+def running_instance():
+    """Get the ping reply of an already running daemon, or None"""
+    try:
+        with LexiaClient(timeout=2.0) as client:
+            return client.ping()
+    except (DaemonUnavailable, OSError, ValueError):
+        return None
+
+class _RequestError(Exception):
+    pass
+
+class RewriteDaemon:
+    def __init__(self, sock):
+        self.sock = sock
+        self.token = secrets.token_hex(16)
+        self.server = None
+        self.connections = 0
+
+    async def start(self):
+        """Start serving on the engine loop and publish the address for clients"""
+        self.server = await asyncio.start_server(self._handle_connection, sock=self.sock, limit=MAX_LINE_BYTES)
+        self._write_daemon_file()
+
+    def _write_daemon_file(self):
+        path = daemon_file_path()
+        info = {"host": HOST, "port": self.sock.getsockname()[1], "token": self.token, "pid": os.getpid()}
+        # Owner-only: the token is what keeps other local users off your API keys
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+
+    def remove_daemon_file(self):
+        try:
+            with open(daemon_file_path(), "r", encoding="utf-8") as f:
+                if json.load(f).get("token") != self.token:
+                    return
+            os.remove(daemon_file_path())
+        except (OSError, ValueError):
+            pass
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        tasks = set()
+
+        # Called from request tasks and engine callbacks, all on the engine loop
+        def send(request_id, **message):
+            if not writer.is_closing():
+                writer.write(json.dumps(dict(message, id=request_id), ensure_ascii=False).encode("utf-8") + b"\n")
+
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # Over the line limit, or the client went away
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    send(None, done=True, error=f"Invalid request: {e}")
+                    continue
+                # Requests on one connection run concurrently and are told apart by id
+                task = asyncio.ensure_future(self._serve(request, send, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            # A client that disconnects abandons its requests
+            for task in tasks:
+                task.cancel()
+            self.connections -= 1
+            writer.close()
+
+    async def _serve(self, request, send, writer):
+        request_id = request.get("id")
+        try:
+            if not secrets.compare_digest(str(request.get("token", "")), self.token):
+                raise _RequestError("Invalid token")
+            reply = await self._dispatch(request, lambda **message: send(request_id, **message))
+            send(request_id, done=True, **reply)
+        except _RequestError as e:
+            send(request_id, done=True, error=str(e))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Daemon request failed: {e}")
+            send(request_id, done=True, error=str(e))
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def _dispatch(self, request, send):
+        # Imported here so main.py can claim the port before the OpenAI SDK loads
+        from batch import BatchItem, run_batch
+        from ratelimit import get_scheduler_status
+        from rewriter import rewrite_async, get_connection_stats, get_prompt_cache_stats
+        from version import __version__
+
+        op = request.get("op")
+        if op == "ping":
+            return {"version": __version__, "pid": os.getpid()}
+        if op == "status":
+            return {"schedulers": get_scheduler_status(), "connections": get_connection_stats(),
+                    "prompt_cache": get_prompt_cache_stats()}
+        if op not in ("rewrite", "stream", "batch"):
+            raise _RequestError(f"Unknown op: {op!r}")
+
+        model = request.get("model")
+        if model is not None and model not in MODELS:
+            raise _RequestError(f"Unknown model: {model!r}")
+        tone = request.get("tone") or "Neutral"
+        num_alternatives = request.get("alternatives")
+        if num_alternatives is not None and (not isinstance(num_alternatives, int) or not 1 <= num_alternatives <= 5):
+            raise _RequestError("alternatives must be between 1 and 5")
+        fresh = bool(request.get("fresh"))
+
+        if op == "batch":
+            items = request.get("items")
+            if not isinstance(items, list) or not all(isinstance(item, dict) and isinstance(item.get("text"), str)
+                                                      and item.get("model") in MODELS + (None,) for item in items):
+                raise _RequestError("items must be a list of objects with a \"text\" string and a known model")
+            concurrency = min(MAX_BATCH_CONCURRENCY, max(1, int(request.get("concurrency") or 4)))
+            batch_items = [BatchItem(str(item.get("id", index)), item["text"], item.get("tone"), item.get("model"))
+                           for index, item in enumerate(items, 1)]
+            totals = await run_batch(batch_items, lambda record: send(event="result", result=record), tone, model,
+                                     num_alternatives or 1, concurrency, fresh)
+            return {"totals": totals}
+
+        text = request.get("text")
+        if not isinstance(text, str) or not text.strip():
+            raise _RequestError("text must be a non-empty string")
+        stats = {}
+        callbacks = {}
+        if op == "stream":
+            streamed = {}
+
+            def on_text(index, partial):
+                previous = streamed.get(index, "")
+                if partial.startswith(previous):
+                    send(event="text", index=index, delta=partial[len(previous):])
+                else:
+                    send(event="text", index=index, text=partial)
+                streamed[index] = partial
+
+            callbacks = {
+                "on_text": on_text,
+                "on_alternative": lambda index, alternative: send(event="alternative", index=index, text=alternative),
+                "on_wait": lambda provider, seconds, reason, queued: send(event="wait", provider=provider,
+                                                                          seconds=round(seconds, 2), reason=reason,
+                                                                          queued=queued)
+            }
+        alternatives = await rewrite_async(text, tone, num_alternatives, model_override=model, force_fresh=fresh,
+                                           stats=stats, **callbacks)
+        if alternatives and alternatives[0].startswith("Error:"):
+            raise _RequestError(alternatives[0][len("Error:"):].strip())
+        return {"alternatives": alternatives, "model": stats.get("model"), "cached": stats.get("cached", False),
+                "usage": stats.get("usage")}
+
+def start_daemon(sock):
+    """Start a daemon on the engine loop for an already claimed port; blocks until it is listening"""
+    daemon = RewriteDaemon(sock)
+    get_engine().submit(daemon.start()).result()
+    return daemon
+
+def main(argv=None):
+    """Run the daemon headless until interrupted"""
+    import argparse
+    import time
+    import rewriter
+
+    parser = argparse.ArgumentParser(prog="lexia daemon", description="Serve Lexia rewrites to local tools")
+    parser.add_argument("--port", type=int, default=None, help="localhost port (default: the daemon_port setting)")
+    args = parser.parse_args(argv)
+
+    from settings import get_settings
+    port = args.port if args.port is not None else get_settings().get("daemon_port", DEFAULT_PORT)
+    instance_lock = claim_instance_lock()
+    if instance_lock is None:
+        if running_instance():
+            print("Lexia is already running; its daemon is serving requests")
+            return 0
+        print("Error: Lexia is already running without its daemon")
+        return 1
+    try:
+        sock = claim_port(port)
+    except OSError as e:
+        print(f"Error: can't listen on {HOST}:{port} ({e})")
+        return 1
+    daemon = start_daemon(sock)
+    rewriter.get_clients()
+    print(f"Lexia daemon listening on {HOST}:{sock.getsockname()[1]} (client details in {daemon_file_path()})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.remove_daemon_file()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
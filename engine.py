@@ -0,0 +1,67 @@
+"""
+Asyncio engine for Lexia
+
+All API traffic runs on one long-lived event loop in a background thread, so
+concurrent rewrites, prefetches and streams share a single connection pool
+without a thread per request. Other threads hand coroutines to the loop with
+submit(), which returns a concurrent.futures.Future; cancelling that future
+cancels the coroutine and aborts its HTTP request.
+"""
+
+import asyncio
+import threading
+
+class RewriteEngine:
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    @property
+    def loop(self):
+        """The engine's event loop, started on first use"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(loop, ready),
+                                                name="lexia-engine", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def in_engine_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro):
+        """Run a coroutine on the engine loop from any thread and get a Future for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call_soon(self, callback, *args):
+        """Run a plain callback on the engine loop from any thread"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    def stop(self):
+        """Stop the loop; pending work is abandoned"""
+        with self._lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
+                self._thread = None
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Get the process-wide rewrite engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RewriteEngine()
+        return _engine
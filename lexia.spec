@@ -17,7 +17,6 @@ a = Analysis(
         'pyautogui',
         'threading',
         'openai',
-        'psutil',
         'webbrowser',
         'json',
         'urllib.request',
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Client for the Lexia rewrite daemon
+
+Standard library only, so editors and scripts can use Lexia's running engine
+(its warm connections, cache and rate limiter) without importing the OpenAI
+SDK or reading Lexia's settings. The daemon publishes its port and an access
+token in a small JSON file (~/.lexia_daemon.json, or $LEXIA_DAEMON_FILE).
+
+Protocol: newline-delimited JSON over a localhost TCP connection. Each request
+is an object with an "id", the "token" and an "op"; every message answering
+it carries the same "id", and the last one has "done": true (plus "error" if
+it failed).
+
+    ping                              -> {"version", "pid"}
+    status                            -> {"schedulers", "connections", "prompt_cache"}
+    rewrite {text, tone, model, alternatives, fresh}
+                                      -> {"alternatives", "model", "cached", "usage"}
+    stream  (same fields)             -> {"event": "text", "index", "delta" | "text"},
+                                         {"event": "alternative", "index", "text"},
+                                         {"event": "wait", "provider", "seconds", "reason", "queued"},
+                                         then the rewrite reply
+    batch   {items: [{id, text, tone, model}], tone, model, alternatives, concurrency, fresh}
+                                      -> {"event": "result", "result": {...}} per item, then {"totals"}
+
+Usage:
+    python lexia_client.py --tone Formal "text to rewrite"
+    echo "text to rewrite" | python lexia_client.py --stream -
+"""
+
+import argparse
+import itertools
+import json
+import os
+import socket
+import sys
+
+DAEMON_FILE_ENV = "LEXIA_DAEMON_FILE"
+CONNECT_TIMEOUT = 2.0
+
+def daemon_file_path():
+    """Where the running daemon publishes its address and token"""
+    return os.environ.get(DAEMON_FILE_ENV) or os.path.join(os.path.expanduser("~"), ".lexia_daemon.json")
+
+class DaemonUnavailable(Exception):
+    """No daemon is running, or it could not be reached"""
+
+class DaemonError(Exception):
+    """The daemon answered a request with an error"""
+
+def read_daemon_file(path=None):
+    try:
+        with open(path or daemon_file_path(), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        return info["host"], int(info["port"]), info["token"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise DaemonUnavailable(f"Lexia daemon not running ({e})")
+
+class LexiaClient:
+    """A connection to the daemon; requests on one client are sent one at a time"""
+
+    def __init__(self, path=None, timeout=None):
+        self.host, self.port, self.token = read_daemon_file(path)
+        self.timeout = timeout
+        self._sock = None
+        self._reader = None
+        self._ids = itertools.count(1)
+
+    def connect(self):
+        if self._sock is None:
+            try:
+                self._sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+            except OSError as e:
+                raise DaemonUnavailable(f"Lexia daemon not reachable at {self.host}:{self.port} ({e})")
+            self._sock.settimeout(self.timeout)
+            self._reader = self._sock.makefile("rb")
+        return self
+
+    def close(self):
+        if self._sock is not None:
+            self._reader.close()
+            self._sock.close()
+            self._sock = self._reader = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _request(self, op, **fields):
+        """Send a request and yield every message answering it, ending with the final one"""
+        self.connect()
+        request_id = next(self._ids)
+        message = dict(fields, id=request_id, op=op, token=self.token)
+        try:
+            self._sock.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            while True:
+                line = self._reader.readline()
+                if not line:
+                    raise DaemonUnavailable("Lexia daemon closed the connection")
+                reply = json.loads(line)
+                if reply.get("id") != request_id:
+                    continue
+                if reply.get("done"):
+                    if "error" in reply:
+                        raise DaemonError(reply["error"])
+                    yield reply
+                    return
+                yield reply
+        except OSError as e:
+            self.close()
+            raise DaemonUnavailable(f"Lost the connection to the Lexia daemon ({e})")
+
+    def _call(self, op, **fields):
+        reply = None
+        for reply in self._request(op, **fields):
+            pass
+        return reply
+
+    def ping(self):
+        return self._call("ping")
+
+    def status(self):
+        return self._call("status")
+
+    def rewrite(self, text, tone="Neutral", model=None, alternatives=None, fresh=False):
+        """Rewrite text and get the list of alternatives"""
+        return self._call("rewrite", text=text, tone=tone, model=model, alternatives=alternatives,
+                          fresh=fresh)["alternatives"]
+
+    def stream(self, text, tone="Neutral", model=None, alternatives=None, fresh=False):
+        """Rewrite text, yielding streamed events and then the final reply"""
+        return self._request("stream", text=text, tone=tone, model=model, alternatives=alternatives, fresh=fresh)
+
+    def batch(self, items, tone="Neutral", model=None, alternatives=1, concurrency=4, fresh=False):
+        """Rewrite a list of {"id", "text", ...} items, yielding each result record as it finishes"""
+        for reply in self._request("batch", items=list(items), tone=tone, model=model, alternatives=alternatives,
+                                   concurrency=concurrency, fresh=fresh):
+            if reply.get("event") == "result":
+                yield reply["result"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewrite text with the running Lexia daemon")
+    parser.add_argument("text", help="text to rewrite, or - for stdin")
+    parser.add_argument("--tone", default="Neutral", help="preset tone or a custom instruction")
+    parser.add_argument("--model", help="gpt-4 or llama-4-scout (default: the model from Lexia's settings)")
+    parser.add_argument("-n", "--alternatives", type=int, help="number of alternatives")
+    parser.add_argument("--stream", action="store_true", help="print the first alternative as it streams")
+    parser.add_argument("--fresh", action="store_true", help="skip Lexia's rewrite cache")
+    args = parser.parse_args(argv)
+    text = sys.stdin.read() if args.text == "-" else args.text
+
+    try:
+        with LexiaClient() as client:
+            if not args.stream:
+                print("\n\n".join(client.rewrite(text, args.tone, args.model, args.alternatives, args.fresh)))
+                return 0
+            streamed = False
+            for event in client.stream(text, args.tone, args.model, args.alternatives, args.fresh):
+                if event.get("event") == "text" and event["index"] == 0 and "delta" in event:
+                    sys.stdout.write(event["delta"])
+                    sys.stdout.flush()
+                    streamed = True
+                elif event.get("done") and not streamed:
+                    # Answered from the cache (or restarted mid-stream): print the final result instead
+                    sys.stdout.write(event["alternatives"][0])
+            print()
+            return 0
+    except (DaemonUnavailable, DaemonError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,25 +10,67 @@ Author: Muhammad Jawad Bashir
 License: MIT
 """
 
-import pyperclip
-import keyboard
-import pyautogui
-import threading
 import time
+
+_startup_started = time.perf_counter()
+
+import threading
 import os
 import sys
-import pystray
-from PIL import Image, ImageDraw
-from ui_enhanced import show_popup
-from settings import load_settings, get_api_keys, show_settings_window
-import tkinter as tk
+from settings import get_settings, get_api_keys
+from tracing import start_trace
+
+# Only what registering the hotkey needs is imported at startup, and keyboard
+# (which needs root on Linux) only once the headless commands are ruled out. The
+# tray (pystray, PIL) loads on its own thread, and the popup UI, clipboard
+# capture and OpenAI SDK are imported and built by warm_up() once the hotkey is live.
+
+# Set to print startup timings and exit once warm-up is done (benchmarks/bench_startup.py)
+STARTUP_PROBE_ENV = "LEXIA_STARTUP_PROBE"
 
 last_hotkey_time = 0
 window_open = False
 tray_icon = None
+popup_app = None
+daemon_listener = None
+rewrite_daemon = None
+instance_lock = None
+_warm = threading.Event()
+
+def warm_up():
+    """Import and build everything the first hotkey needs, in the background"""
+    global popup_app, rewrite_daemon
+    if daemon_listener is not None:
+        # First, so other tools (and a second launch) reach this instance while the popup builds
+        try:
+            from daemon import start_daemon
+            rewrite_daemon = start_daemon(daemon_listener)
+        except Exception as e:
+            print(f"Error starting the rewrite daemon: {e}")
+    try:
+        import clipboard
+        import rewriter
+        import tokens
+        from ui_enhanced import PopupApp
+        app = PopupApp()
+        app.start()
+        popup_app = app
+        # Build the pooled API clients so the first request only has to connect
+        rewriter.get_clients()
+        tokens.load_tokenizer()
+    except Exception as e:
+        print(f"Error preparing the rewrite window: {e}")
+    finally:
+        _warm.set()
+
+def get_popup_app():
+    """Get the popup app, waiting for warm-up if the hotkey beat it"""
+    _warm.wait()
+    return popup_app
 
 def create_icon_image():
     """Create a simple icon for the system tray"""
+    from PIL import Image, ImageDraw
     # Create a 64x64 image with a white background
     img = Image.new('RGB', (64, 64), color='white')
     draw = ImageDraw.Draw(img)
@@ -44,36 +86,42 @@ def quit_app(icon, item):
     print("Exiting Lexia...")
     icon.stop()
     keyboard.unhook_all()
-    # Clean up lock file
-    lock_file = "app.lock"
-    if os.path.exists(lock_file):
-        os.remove(lock_file)
+    if rewrite_daemon:
+        rewrite_daemon.remove_daemon_file()
     os._exit(0)
 
 def show_settings(icon, item):
     """Show settings window from system tray"""
-    root = tk.Tk()
-    root.withdraw()
-    show_settings_window(root)
-    root.destroy()
+    from settings import show_settings_window
+    app = get_popup_app()
+    if app:
+        app.post(lambda: show_settings_window(app.root))
 
 def show_about(icon, item):
     """Show about dialog from system tray"""
     from ui_enhanced import show_about_dialog
-    root = tk.Tk()
-    root.withdraw()
-    show_about_dialog(root)
-    root.destroy()
+    app = get_popup_app()
+    if app:
+        app.post(lambda: show_about_dialog(app.root))
+
+def show_latency_stats(icon, item):
+    """Show per-stage latency percentiles from system tray"""
+    from ui_enhanced import show_latency_dialog
+    app = get_popup_app()
+    if app:
+        app.post(lambda: show_latency_dialog(app.root))
 
 def run_tray_icon():
     """Run the system tray icon"""
     global tray_icon
+    import pystray
     
     # Create menu
     menu = pystray.Menu(
         pystray.MenuItem("Lexia - Text Rewriter", lambda: None, enabled=False),
         pystray.Menu.SEPARATOR,
         pystray.MenuItem("Settings", show_settings),
+        pystray.MenuItem("Latency Stats", show_latency_stats),
         pystray.MenuItem("About", show_about),
         pystray.Menu.SEPARATOR,
         pystray.MenuItem("Quit", quit_app)
@@ -86,6 +134,10 @@ def run_tray_icon():
     # Run the icon
     tray_icon.run()
 
+def on_popup_closed():
+    global window_open
+    window_open = False
+
 def handle_hotkey():
     global last_hotkey_time, window_open
     current_time = time.time()
@@ -102,22 +154,36 @@ def handle_hotkey():
     
     last_hotkey_time = current_time
     window_open = True
+    trace = start_trace()
     
-    # Simulate Ctrl+C to copy selected text
-    pyautogui.hotkey('ctrl', 'c')
-    time.sleep(0.2)  # Give clipboard time to update
-
-    original_text = pyperclip.paste().strip()
+    app = get_popup_app()
+    if app is None:
+        window_open = False
+        return
+    
+    from clipboard import capture_selection
+    with trace.span("capture"):
+        # Copy the selected text, returning as soon as it reaches the clipboard
+        original_text = capture_selection().strip()
     if not original_text:
         print("No text selected.")
         window_open = False
         return
 
-    # Open the UI window
-    show_popup(original_text)
-    window_open = False  # Reset when window closes
+    # Open the prebuilt UI window; window_open is reset when it closes
+    app.show(original_text, trace, on_close=on_popup_closed)
 
 if __name__ == "__main__":
+    # Headless commands skip the hotkey, tray and keyboard hook
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "daemon":
+        from daemon import main as daemon_main
+        sys.exit(daemon_main(sys.argv[2:]))
+
+    import keyboard
+    
     # Set process name for Task Manager
     try:
         import ctypes
@@ -125,37 +191,24 @@ if __name__ == "__main__":
     except:
         pass
     
-    # Check for lock file to prevent multiple instances
-    lock_file = "app.lock"
-    if os.path.exists(lock_file):
-        # Check if the process is actually running
+    # One Lexia per user, daemon or not; the OS releases the lock however the process ends
+    from daemon import claim_instance_lock, claim_port
+    instance_lock = claim_instance_lock()
+    if instance_lock is None:
+        print("Application already running! Please close the existing instance first.")
+        sys.exit(1)
+    settings = get_settings()
+    if settings.get("daemon_enabled", True):
+        daemon_port = settings.get("daemon_port", 47321)
         try:
-            with open(lock_file, 'r') as f:
-                old_pid = int(f.read().strip())
-            
-            # Try to check if process is still running (Windows)
-            try:
-                import psutil
-                if psutil.pid_exists(old_pid):
-                    print("Application already running! Please close the existing instance first.")
-                    sys.exit(1)
-                else:
-                    print("Removing stale lock file...")
-                    os.remove(lock_file)
-            except ImportError:
-                # psutil not available, remove old lock file
-                print("Removing stale lock file...")
-                os.remove(lock_file)
-        except:
-            # Invalid lock file, remove it
-            os.remove(lock_file)
+            daemon_listener = claim_port(daemon_port)
+        except OSError as e:
+            print(f"Error: port {daemon_port} for the rewrite daemon is in use by another program ({e}). "
+                  f"Set daemon_port to a free port, or daemon_enabled to false, in settings.json.")
+            sys.exit(1)
     
-    # Create lock file
     try:
-        with open(lock_file, 'w') as f:
-            f.write(str(os.getpid()))
-        
-        settings = load_settings()
+        settings = get_settings()
         
         # Check for API keys on first run
         keys = get_api_keys()
@@ -166,13 +219,14 @@ if __name__ == "__main__":
             
             # Show settings window for first-time setup
             import tkinter as tk
+            from settings import show_settings_window
             root = tk.Tk()
             root.withdraw()  # Hide the root window
             show_settings_window(root)
             root.destroy()
             
             # Reload settings after setup
-            settings = load_settings()
+            settings = get_settings()
             keys = get_api_keys()
             
             # Check again if keys were added
@@ -196,13 +250,24 @@ if __name__ == "__main__":
         if keys["groq"]:
             print("✓ Groq API key configured")
         
+        # Register hotkey first; everything else loads behind it
+        keyboard.add_hotkey(hotkey, handle_hotkey)
+        hotkey_registered = time.perf_counter()
+        
+        # Build the popup and load the OpenAI SDK in the background so the hotkey only has to show it
+        threading.Thread(target=warm_up, name="lexia-warm-up", daemon=True).start()
+        
+        if os.environ.get(STARTUP_PROBE_ENV):
+            _warm.wait()
+            print(f"startup: hotkey_registered_ms={(hotkey_registered - _startup_started) * 1000:.1f} "
+                  f"warm_ms={(time.perf_counter() - _startup_started) * 1000:.1f} "
+                  f"popup_ready={popup_app is not None}", flush=True)
+            sys.exit(0)
+        
         # Start system tray icon in a separate thread
         tray_thread = threading.Thread(target=run_tray_icon, daemon=True)
         tray_thread.start()
         
-        # Register hotkey
-        keyboard.add_hotkey(hotkey, handle_hotkey)
-        
         # Keep the main thread alive
         try:
             keyboard.wait()
@@ -214,5 +279,5 @@ if __name__ == "__main__":
         if tray_icon:
             tray_icon.stop()
         keyboard.unhook_all()
-        if os.path.exists(lock_file):
-            os.remove(lock_file)
+        if rewrite_daemon:
+            rewrite_daemon.remove_daemon_file()
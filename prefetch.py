@@ -0,0 +1,154 @@
+"""
+Speculative prefetch for Lexia
+
+Once a rewrite lands in the popup, the tones the user is most likely to try
+next (learned from past tone switches) and/or the other model are rewritten in
+the background so switching is answered from the rewrite cache, or, if the
+prefetch is still running, by waiting for it. Prefetching is opt-in, bounded
+by a per-popup request and token budget, and cancelled as soon as the popup
+closes. Only switches between preset tones are learned; custom instructions
+are one-offs.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+from rewriter import prefetch_async
+from engine import get_engine
+from settings import get_settings, get_api_keys
+from tokens import count_tokens
+from ratelimit import background_work
+
+TONE_USAGE_FILE = "tone_usage.json"
+PRESET_TONES = ["Neutral", "Formal", "Friendly", "Professional", "Concise", "Creative"]
+MODEL_PROVIDERS = {"gpt-4": "openai", "llama-4-scout": "groq"}
+MAX_CONCURRENT_PREFETCHES = 2
+
+_usage_lock = threading.Lock()
+_usage = None
+_executor = None
+
+def _load_usage():
+    global _usage
+    if _usage is None:
+        try:
+            with open(TONE_USAGE_FILE, 'r') as f:
+                _usage = json.load(f)
+        except (OSError, ValueError):
+            _usage = {}
+        # Older files also recorded switches from custom instructions
+        _usage = {tone: {next_tone: n for next_tone, n in counts.items() if next_tone in PRESET_TONES}
+                  for tone, counts in _usage.items() if tone in PRESET_TONES and isinstance(counts, dict)}
+    return _usage
+
+def record_tone_switch(previous_tone, new_tone):
+    """Remember that the user went from one preset tone to another"""
+    if previous_tone == new_tone or previous_tone not in PRESET_TONES or new_tone not in PRESET_TONES:
+        return
+    with _usage_lock:
+        usage = _load_usage()
+        transitions = usage.setdefault(previous_tone, {})
+        transitions[new_tone] = transitions.get(new_tone, 0) + 1
+        try:
+            with open(TONE_USAGE_FILE, 'w') as f:
+                json.dump(usage, f, indent=2)
+        except OSError as e:
+            print(f"Error saving tone usage: {e}")
+
+def submit_tone_switch(previous_tone, new_tone):
+    """Record a tone switch on a worker thread; does nothing unless prefetching is enabled"""
+    global _executor
+    if not get_settings().get("prefetch_enabled", False):
+        return None
+    with _usage_lock:
+        if _executor is None:
+            # One worker, so the file is written in the order switches happened
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexia-tone-usage")
+    return _executor.submit(record_tone_switch, previous_tone, new_tone)
+
+def predict_next_tones(current_tone, count):
+    """Get the preset tones most likely to be picked after the current one"""
+    with _usage_lock:
+        usage = _load_usage()
+        transitions = dict(usage.get(current_tone, {}))
+        overall = {}
+        for counts in usage.values():
+            for tone, n in counts.items():
+                overall[tone] = overall.get(tone, 0) + n
+
+    candidates = [tone for tone in PRESET_TONES if tone != current_tone]
+    # Direct transitions first, then overall popularity, then the dropdown order
+    candidates.sort(key=lambda tone: (-transitions.get(tone, 0), -overall.get(tone, 0), PRESET_TONES.index(tone)))
+    return candidates[:count]
+
+def estimate_request_tokens(text, num_alternatives):
+    """Rough token cost of a rewrite: the prompt plus one copy of the text per alternative"""
+    text_tokens = count_tokens(text)
+    return text_tokens * (num_alternatives + 1) + 150
+
+class Prefetcher:
+    """Background rewrites for one popup session"""
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.get("prefetch_enabled", False)
+        self.max_tones = settings.get("prefetch_tones", 2)
+        self.other_model = settings.get("prefetch_other_model", True)
+        self.requests_left = settings.get("prefetch_max_requests", 3)
+        self.tokens_left = settings.get("prefetch_max_tokens", 6000)
+        self.num_alternatives = settings.get("num_alternatives", 3)
+        self._cancelled = False
+        self._submitted = set()
+        self._futures = []
+        self._lock = threading.Lock()
+        self._semaphore = None
+
+    def _candidates(self, tone, model):
+        candidates = []
+        if tone in PRESET_TONES:
+            candidates += [(next_tone, model) for next_tone in predict_next_tones(tone, self.max_tones)]
+        if self.other_model:
+            keys = get_api_keys()
+            for other_model, provider in MODEL_PROVIDERS.items():
+                if other_model != model and keys.get(provider):
+                    # The same tone on the other model is the most likely model switch
+                    candidates.insert(0, (tone, other_model))
+        return candidates
+
+    def start(self, original, tone, model):
+        """Queue prefetches for likely next requests after a rewrite has landed"""
+        if not self.enabled or self._cancelled:
+            return
+        cost = estimate_request_tokens(original, self.num_alternatives)
+        with self._lock:
+            for candidate in self._candidates(tone, model):
+                if candidate in self._submitted:
+                    continue
+                if self.requests_left <= 0 or self.tokens_left < cost:
+                    break
+                self.requests_left -= 1
+                self.tokens_left -= cost
+                self._submitted.add(candidate)
+                self._futures.append(get_engine().submit(self._prefetch(original, *candidate)))
+
+    async def _prefetch(self, original, tone, model):
+        # Yield provider capacity to interactive rewrites (this task has its own context)
+        background_work.set(True)
+        # Created on the engine loop, which is the only place it is used
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENT_PREFETCHES)
+        async with self._semaphore:
+            try:
+                # Results land in the rewrite cache, which is where the popup will find them
+                await prefetch_async(original, tone, num_alternatives=self.num_alternatives, model_override=model)
+            except Exception as e:
+                print(f"Prefetch failed: {e}")
+
+    def cancel(self):
+        """Abandon queued and in-flight prefetches"""
+        with self._lock:
+            self._cancelled = True
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
@@ -0,0 +1,165 @@
+"""
+Prompt templates for Lexia
+
+Every request is a system message and a user message rendered from a pair of
+templates for its model family (the response format it is asked for):
+
+    gpt      '---ALTERNATIVE---' separators
+    llama    'Version N:' headers
+    json     a {"alternatives": [...]} object (JSON mode)
+    single   one plain rewrite (parallel generation)
+
+The default system templates have no fields, so each family's system message
+is byte-identical across requests and providers can serve that prefix from
+their prompt cache. Everything that varies goes in the user message, text
+first: the same selection is often rewritten again in another tone or
+prefetched for several, and with the count and tone at the very end those
+requests share everything up to them (providers only cache prefixes of about
+1024 tokens or more, so this is what pays off for long texts).
+
+Templates can be overridden per family and role in settings.json:
+
+    "prompt_templates": {"gpt": {"user": "{text}\\n\\nGive {count} rewrites of the text above. {tone_instruction}"}}
+
+Fields: {text}, {count}, {tone} and {tone_instruction} ("Use a formal tone."
+or "Rewriting instruction: ..." for a custom one). Templates are compiled
+once into literal/field parts; a broken override is reported and the default
+used instead.
+"""
+
+import hashlib
+import string
+from settings import get_settings
+
+PRESET_TONES = ["Neutral", "Formal", "Friendly", "Professional", "Concise", "Creative"]
+FIELDS = ("text", "count", "tone", "tone_instruction")
+
+_SYSTEM_BASE = ("You are a helpful assistant that rewrites text to improve grammar, clarity, and tone. When the user "
+                "gives a specific rewriting instruction, follow it precisely. When asked for several alternative "
+                "rewrites, give each a slightly different approach or style while keeping the requested tone.")
+
+DEFAULT_TEMPLATES = {
+    "gpt": {
+        "system": _SYSTEM_BASE + " Separate the alternatives with '---ALTERNATIVE---' markers.",
+        "user": ("Text to rewrite:\n\n{text}\n\nRewrite the text above in {count} different ways.\n{tone_instruction}\n"
+                 "Please provide {count} alternatives, separated by '---ALTERNATIVE---' markers.")
+    },
+    "llama": {
+        "system": _SYSTEM_BASE + " Label each version clearly as 'Version 1:', 'Version 2:', etc.",
+        "user": ("Original text: {text}\n\nRewrite the text above in {count} different ways.\n{tone_instruction}\n"
+                 "Please provide exactly {count} rewritten versions.")
+    },
+    "json": {
+        "system": _SYSTEM_BASE + (' Reply with a JSON object of the form {{"alternatives": ["...", "..."]}} '
+                                  'holding the rewritten versions as strings.'),
+        "user": ("Text to rewrite:\n\n{text}\n\nRewrite the text above in {count} different ways.\n{tone_instruction}\n"
+                 "Provide exactly {count} rewritten versions.")
+    },
+    "single": {
+        "system": ("You are a helpful assistant that rewrites text to improve grammar, clarity, and tone. When the "
+                   "user gives a specific rewriting instruction, follow it precisely. Reply with only the rewritten "
+                   "text."),
+        "user": "Text to rewrite:\n\n{text}\n\nRewrite the text above.\n{tone_instruction}"
+    }
+}
+
+class PromptTemplate:
+    """A template compiled into literal text and {field} slots"""
+
+    def __init__(self, source):
+        self.source = source
+        self.parts = []
+        try:
+            parsed = list(string.Formatter().parse(source))
+        except ValueError as e:
+            raise ValueError(f"{e} (write {{{{ and }}}} for literal braces)")
+        for literal, field, format_spec, conversion in parsed:
+            if literal:
+                self.parts.append((literal, False))
+            if field is not None:
+                if field not in FIELDS or format_spec or conversion:
+                    raise ValueError(f"unknown field {{{field}}}; use {', '.join('{' + f + '}' for f in FIELDS)}")
+                self.parts.append((field, True))
+        self.fields = {part for part, is_field in self.parts if is_field}
+
+    def render(self, values):
+        return "".join(values[part] if is_field else part for part, is_field in self.parts)
+
+# Compiled templates by source, so each override is parsed once
+_compiled = {source: PromptTemplate(source) for family in DEFAULT_TEMPLATES.values() for source in family.values()}
+
+# Problems with the prompt_templates setting already reported, so each is printed once
+_reported = set()
+
+def _report(message):
+    if message not in _reported:
+        _reported.add(message)
+        print(message)
+
+def _override(family, role):
+    """The settings' template source for a family and role, or None if there is no usable one"""
+    overrides = get_settings().get("prompt_templates") or {}
+    if not isinstance(overrides, dict):
+        _report("Error in the prompt templates setting: expected an object of families; using the defaults")
+        return None
+    family_overrides = overrides.get(family) or {}
+    if not isinstance(family_overrides, dict):
+        _report(f"Error in the {family} prompt templates: expected an object with \"system\" and/or \"user\"; "
+              f"using the defaults")
+        return None
+    source = family_overrides.get(role)
+    if source is not None and not isinstance(source, str):
+        _report(f"Error in the {family} {role} prompt template: expected a string; using the default")
+        return None
+    return source
+
+def _template(family, role):
+    source = _override(family, role) or DEFAULT_TEMPLATES[family][role]
+    template = _compiled.get(source)
+    if template is None:
+        try:
+            template = PromptTemplate(source)
+            if role == "system" and template.fields:
+                print(f"Warning: the {family} system prompt template uses fields, so providers can't cache it")
+        except ValueError as e:
+            print(f"Error in the {family} {role} prompt template: {e}; using the default")
+            template = _compiled[DEFAULT_TEMPLATES[family][role]]
+        _compiled[source] = template
+    return template
+
+def tone_instruction(tone):
+    if tone in PRESET_TONES:
+        return f"Use a {tone.lower()} tone."
+    return f"Rewriting instruction: {tone}"
+
+def prompt_family(model, structured=False):
+    if structured:
+        return "json"
+    return "llama" if model == "llama-4-scout" else "gpt"
+
+def _render(family, original_text, tone, num_alternatives):
+    values = {"text": original_text, "count": str(num_alternatives), "tone": tone,
+              "tone_instruction": tone_instruction(tone)}
+    return [
+        {"role": "system", "content": _template(family, "system").render(values)},
+        {"role": "user", "content": _template(family, "user").render(values)}
+    ]
+
+def prompt_fingerprint(model, json_mode=False, parallel=False):
+    """Digest of the templates a rewrite may be prompted with, for telling cached results apart.
+
+    json_mode is whether the model may be asked for JSON; parallel is the
+    one-rewrite-per-request generation mode.
+    """
+    families = ["single"] if parallel else [prompt_family(model)] + (["json"] if json_mode else [])
+    sources = [_template(family, role).source for family in families for role in ("system", "user")]
+    digest = hashlib.sha256("\0".join(sources).encode("utf-8")).hexdigest()[:16]
+    return ("parallel:" if parallel else "combined:") + digest
+
+def build_messages(original_text, tone, num_alternatives, model, structured=False):
+    """Messages asking model for num_alternatives rewrites in its response format"""
+    return _render(prompt_family(model, structured), original_text, tone, num_alternatives)
+
+def build_single_messages(original_text, tone):
+    """Messages asking for exactly one rewrite, used when alternatives are generated in parallel"""
+    return _render("single", original_text, tone, 1)
@@ -0,0 +1,249 @@
+"""
+Provider rate limiting for Lexia
+
+Each provider gets a scheduler on the engine loop with token buckets for
+requests/min and tokens/min and a cap on concurrent requests. The buckets
+start from conservative defaults and follow the x-ratelimit-* headers of
+every response; a 429 blocks the provider until its Retry-After has passed.
+
+Work that has to wait is queued here rather than failing. Callers can watch
+the waits through the wait-listener context variable, and background work
+(prefetches, batches) yields to interactive requests: it waits in take()
+while they are queued, never holds a provider's last concurrency slot, and
+only gets a freed slot when no interactive request is waiting for one.
+"""
+
+import asyncio
+import contextvars
+import re
+import time
+from collections import deque
+
+# Conservative defaults until the provider's headers tell us more
+PROVIDER_LIMITS = {
+    "openai": {"rpm": 500, "tpm": 30000, "concurrency": 8},
+    "groq": {"rpm": 30, "tpm": 30000, "concurrency": 4}
+}
+
+# Concurrency slots per provider that background work may not take
+FOREGROUND_RESERVED_SLOTS = 1
+
+# Waits shorter than this aren't worth reporting
+REPORT_WAIT_THRESHOLD = 0.25
+POLL_INTERVAL = 0.25
+
+# Set by callers that want to hear about waits: listener(provider, seconds, reason, queued)
+wait_listener = contextvars.ContextVar("lexia_wait_listener", default=None)
+# Set for prefetch/batch work, which waits while interactive requests are queued
+background_work = contextvars.ContextVar("lexia_background_work", default=False)
+
+_DURATION_PART_RE = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+def parse_duration(value):
+    """Parse reset durations like '1s', '6m0s', '20ms' or '2m59.56s' into seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+def parse_retry_after(headers):
+    """Seconds to wait from Retry-After / retry-after-ms headers, or None"""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            # An HTTP date
+            from email.utils import parsedate_to_datetime
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    return None
+
+class _Bucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay_for(self, amount):
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class _Slots:
+    """A provider's concurrent request slots, handed to interactive requests first.
+
+    Used like an asyncio.Semaphore; whether a caller is background work is
+    read from background_work when it acquires.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.in_use = 0
+        # Futures of callers waiting for a slot, interactive and background
+        self._waiters = {False: deque(), True: deque()}
+
+    def _can_take(self, background):
+        if not background:
+            return self.in_use < self.capacity
+        return (not self._waiters[False]
+                and self.in_use < max(1, self.capacity - FOREGROUND_RESERVED_SLOTS))
+
+    def _wake(self):
+        for background in (False, True):
+            waiters = self._waiters[background]
+            while waiters and self._can_take(background):
+                future = waiters.popleft()
+                if not future.done():
+                    self.in_use += 1
+                    future.set_result(None)
+
+    async def __aenter__(self):
+        background = background_work.get()
+        waiters = self._waiters[background]
+        if not waiters and self._can_take(background):
+            self.in_use += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just as we were cancelled; pass the slot on
+                self._release()
+            else:
+                waiters.remove(future)
+                # Whoever was queued behind us may be able to go now
+                self._wake()
+            raise
+
+    def _release(self):
+        self.in_use -= 1
+        self._wake()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._release()
+
+class ProviderScheduler:
+    """Request/token buckets, Retry-After blocking and a concurrency cap for one provider.
+
+    Only used from the engine loop.
+    """
+
+    def __init__(self, provider, rpm, tpm, concurrency):
+        self.provider = provider
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.concurrency = concurrency
+        self.blocked_until = 0.0
+        self.queued = 0
+        self._foreground_queued = 0
+        self._slots = _Slots(concurrency)
+
+    def slot(self):
+        """Async context manager holding one of the provider's concurrent request slots"""
+        return self._slots
+
+    def _delay_for(self, cost):
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.blocked_until - now, self.requests.delay_for(1), self.tokens.delay_for(cost))
+
+    async def take(self, cost):
+        """Wait until a request of about cost tokens may be sent, then charge it to the buckets"""
+        background = background_work.get()
+        listener = wait_listener.get()
+        started = time.monotonic()
+        reported = False
+        self.queued += 1
+        if not background:
+            self._foreground_queued += 1
+        try:
+            while True:
+                if background and self._foreground_queued:
+                    delay, reason = POLL_INTERVAL, "yielding to interactive requests"
+                else:
+                    delay = self._delay_for(cost)
+                    reason = "rate limited" if self.blocked_until > time.monotonic() else "pacing requests"
+                if delay <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= min(cost, self.tokens.capacity)
+                    return time.monotonic() - started
+                if listener and (delay >= REPORT_WAIT_THRESHOLD or reported):
+                    reported = True
+                    listener(self.provider, delay, reason, self.queued)
+                await asyncio.sleep(min(delay, POLL_INTERVAL))
+        finally:
+            self.queued -= 1
+            if not background:
+                self._foreground_queued -= 1
+
+    def block_for(self, seconds):
+        """Hold all requests for at least this long, e.g. after a 429"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def note_headers(self, headers):
+        """Follow the provider's view of our remaining quota from x-ratelimit-* headers"""
+        now = time.monotonic()
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if remaining is None:
+                continue
+            try:
+                remaining = float(remaining)
+            except ValueError:
+                continue
+            bucket.refill(now)
+            bucket.level = min(bucket.level, remaining)
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                if reset:
+                    self.block_for(reset)
+        retry_after = parse_retry_after(headers)
+        if retry_after:
+            self.block_for(retry_after)
+
+    def status(self):
+        now = time.monotonic()
+        return {"queued": self.queued, "blocked_for": max(0.0, self.blocked_until - now),
+                "requests_available": int(self.requests.level), "tokens_available": int(self.tokens.level)}
+
+_schedulers = {}
+
+def get_scheduler(provider):
+    """Get the scheduler for a provider"""
+    scheduler = _schedulers.get(provider)
+    if scheduler is None:
+        limits = PROVIDER_LIMITS.get(provider, PROVIDER_LIMITS["openai"])
+        scheduler = _schedulers[provider] = ProviderScheduler(provider, limits["rpm"], limits["tpm"],
+                                                              limits["concurrency"])
+    return scheduler
+
+def get_scheduler_status():
+    """Get queue and quota status per provider"""
+    return {provider: scheduler.status() for provider, scheduler in _schedulers.items()}
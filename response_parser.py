@@ -0,0 +1,284 @@
+"""
+Response parsing for Lexia
+
+Rewrites come back in one of three formats:
+
+- JSON, {"alternatives": ["...", "..."]}, from models whose API has a JSON
+  mode (requested with response_format, so the shape is guaranteed)
+- '---ALTERNATIVE---' separators (GPT without JSON mode)
+- 'Version N:' / '**Version N:**' headers (Llama without JSON mode)
+
+Each format has one streaming parser that makes a single pass over the text
+with precompiled patterns and reports every alternative as soon as it is
+complete. A full (non-streamed) response is parsed by feeding it as a single
+chunk, so both paths share the same code.
+
+Setting LEXIA_RECORD_RESPONSES to a file path appends every raw response to
+it, to grow the corpus of benchmarks/bench_parser.py from real traffic.
+"""
+
+import json
+import os
+import re
+
+ALTERNATIVE_SEPARATOR = "---ALTERNATIVE---"
+
+# "Version 1:", "**Version 1:**", "**Alternative 2: More formal**", "### Option 3:" at the start of a
+# line, matched together with the newline before it: a pattern starting with a literal is searched
+# for much faster than one starting with ^ or an alternation
+HEADER_RE = re.compile(
+    r'\n[ \t]*(?=[#*VAO])(?:#{1,6}[ \t]*)?'
+    r'(?:\*\*[ \t]*(?:Version|Alternative|Option)[ \t]*\d+[^\n*]*\*\*:?'
+    r'|(?:Version|Alternative|Option)[ \t]*\d+[ \t]*:)[ \t]*'
+)
+_BOUNDARY_PREFIXES = (ALTERNATIVE_SEPARATOR, "**Version", "**Alternative", "**Option", "Version", "Alternative", "Option")
+
+def _boundaries(text, start, end):
+    """(start, end, is_header) of the separators and headers within text[start:end], in order"""
+    spans = [(match.start(), match.end(), True) for match in HEADER_RE.finditer(text, start, end)]
+    position = text.find(ALTERNATIVE_SEPARATOR, start, end)
+    while position >= 0:
+        spans.append((position, position + len(ALTERNATIVE_SEPARATOR), False))
+        position = text.find(ALTERNATIVE_SEPARATOR, position + len(ALTERNATIVE_SEPARATOR), end)
+    if len(spans) > 1:
+        spans.sort()
+    return spans
+
+class AlternativeStreamParser:
+    """Incrementally split streamed separator/header output into alternatives.
+
+    Boundaries ('---ALTERNATIVE---' separators or 'Version N:' headers) are only
+    trusted once the line containing them is complete, so a marker split across
+    chunks is never mistaken for content. Only the alternative in progress is
+    buffered, and each line is scanned once.
+    """
+
+    def __init__(self):
+        self.completed = []
+        # Text since the last boundary, starting with a newline so a header on the very first line
+        # matches HEADER_RE, and where scanning resumes (the newline ending the last complete line)
+        self._pending = "\n"
+        self._scan_pos = 0
+        self._seen_header = False
+
+    def feed(self, chunk):
+        """Add streamed text and return any alternatives completed by it"""
+        last_newline = chunk.rfind("\n")
+        self._pending += chunk
+        if last_newline < 0:
+            return []
+        stable_end = len(self._pending) - len(chunk) + last_newline + 1
+
+        newly_completed = []
+        segment_start = 0
+        for start, end, is_header in _boundaries(self._pending, self._scan_pos, stable_end):
+            if start < segment_start:
+                # Overlaps the previous boundary
+                continue
+            self._close_segment(self._pending[segment_start:start], is_header, newly_completed)
+            segment_start = end
+        self._pending = self._pending[segment_start:]
+        self._scan_pos = stable_end - 1 - segment_start
+        return newly_completed
+
+    def _close_segment(self, segment, is_header, newly_completed):
+        segment = segment.strip()
+        # Text before the first "Version 1:" header is a preamble, not an alternative
+        if segment and not (is_header and not self._seen_header and not self.completed):
+            self.completed.append(segment)
+            newly_completed.append(segment)
+        self._seen_header = self._seen_header or is_header
+
+    @property
+    def current(self):
+        """Text of the alternative still being streamed, minus a possibly partial marker"""
+        text = self._pending
+        last_line_start = text.rfind("\n") + 1
+        last_line = text[last_line_start:].lstrip(" \t")
+        if last_line and any(prefix.startswith(last_line) or last_line.startswith(prefix)
+                             for prefix in _BOUNDARY_PREFIXES):
+            text = text[:last_line_start]
+        return text.strip()
+
+    def finish(self):
+        """Flush the final alternative once the stream has ended"""
+        newly_completed = self.feed("\n") if not self._pending.endswith("\n") else []
+        segment = self._pending.strip()
+        if segment:
+            self.completed.append(segment)
+            newly_completed.append(segment)
+        self._pending = ""
+        self._scan_pos = 0
+        return newly_completed
+
+_JSON_ALTERNATIVES_RE = re.compile(r'"alternatives"\s*:\s*\[')
+_JSON_ARRAY_GAP_RE = re.compile(r'[\s,]*')
+_JSON_STRING_RUN_RE = re.compile(r'[^"\\]+')
+_JSON_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+# Enough of the input to hold a "alternatives": [ split across chunks
+_JSON_KEY_LOOKBEHIND = 64
+
+def _json_alternatives(content):
+    """The alternatives in a complete JSON response, or None if it isn't one"""
+    try:
+        parsed = json.loads(content)
+    except ValueError:
+        return None
+    alternatives = parsed
+    if isinstance(parsed, dict):
+        # A model that picked its own key still answers with one list of strings
+        alternatives = parsed.get("alternatives", next(iter(parsed.values()), None) if len(parsed) == 1 else None)
+    if not isinstance(alternatives, list) or not all(isinstance(alt, str) for alt in alternatives):
+        return None
+    return [alt.strip() for alt in alternatives if alt.strip()]
+
+class JsonAlternativesParser:
+    """Incrementally pull the strings out of a streamed {"alternatives": [...]} object.
+
+    Each string is decoded as it arrives and reported once its closing quote
+    does; the string in progress is available as current. finish() checks the
+    result against a full json.loads of the response.
+    """
+
+    def __init__(self):
+        self.completed = []
+        self._raw = []
+        self._buffer = ""
+        self._state = "key"
+        self._current = ""
+
+    def feed(self, chunk):
+        """Add streamed text and return any alternatives completed by it"""
+        self._raw.append(chunk)
+        buffer = self._buffer + chunk
+        position = 0
+        newly_completed = []
+        while True:
+            if self._state == "key":
+                match = _JSON_ALTERNATIVES_RE.search(buffer, position)
+                if match is None:
+                    position = max(position, len(buffer) - _JSON_KEY_LOOKBEHIND)
+                    break
+                position = match.end()
+                self._state = "array"
+            elif self._state == "array":
+                position = _JSON_ARRAY_GAP_RE.match(buffer, position).end()
+                if position >= len(buffer):
+                    break
+                if buffer[position] == '"':
+                    self._state = "string"
+                    self._current = ""
+                    position += 1
+                else:
+                    # The closing bracket, or something that isn't a list of strings
+                    self._state = "done"
+            elif self._state == "string":
+                match = _JSON_STRING_RUN_RE.match(buffer, position)
+                if match:
+                    self._current += match.group()
+                    position = match.end()
+                if position >= len(buffer):
+                    break
+                if buffer[position] == '"':
+                    position += 1
+                    self._state = "array"
+                    text = self._current.strip()
+                    self._current = ""
+                    if text:
+                        self.completed.append(text)
+                        newly_completed.append(text)
+                    continue
+                consumed = self._decode_escape(buffer, position)
+                if not consumed:
+                    # The escape is split across chunks
+                    break
+                position += consumed
+            else:
+                position = len(buffer)
+                break
+        self._buffer = buffer[position:]
+        return newly_completed
+
+    def _decode_escape(self, buffer, position):
+        """Decode the escape at buffer[position] into current; returns characters consumed, 0 if incomplete"""
+        if position + 1 >= len(buffer):
+            return 0
+        escape = buffer[position + 1]
+        if escape != "u":
+            self._current += _JSON_ESCAPES.get(escape, escape)
+            return 2
+        if position + 6 > len(buffer):
+            return 0
+        try:
+            code = int(buffer[position + 2:position + 6], 16)
+        except ValueError:
+            self._current += buffer[position:position + 6]
+            return 6
+        if 0xD800 <= code < 0xDC00:
+            # A surrogate pair arrives as two escapes
+            if position + 12 > len(buffer):
+                return 0
+            if buffer[position + 6:position + 8] == "\\u":
+                try:
+                    low = int(buffer[position + 8:position + 12], 16)
+                except ValueError:
+                    low = 0
+                if 0xDC00 <= low < 0xE000:
+                    self._current += chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00))
+                    return 12
+        self._current += chr(code)
+        return 6
+
+    @property
+    def current(self):
+        """Text of the alternative still being streamed"""
+        return self._current.strip() if self._state == "string" else ""
+
+    def finish(self):
+        """Settle the alternatives once the stream has ended"""
+        newly_completed = []
+        alternatives = _json_alternatives("".join(self._raw))
+        if alternatives is not None:
+            if alternatives[:len(self.completed)] == self.completed:
+                newly_completed = alternatives[len(self.completed):]
+                self.completed.extend(newly_completed)
+        elif self.current:
+            # Cut off mid-string (e.g. by max_tokens): keep what arrived
+            newly_completed = [self.current]
+            self.completed.append(self.current)
+        self._state = "done"
+        self._current = ""
+        return newly_completed
+
+def make_parser(structured):
+    """Get a streaming parser for JSON (structured) or separator/header responses"""
+    return JsonAlternativesParser() if structured else AlternativeStreamParser()
+
+def parse_alternatives(content, structured=False):
+    """Split a complete response into alternatives in one pass"""
+    if structured:
+        alternatives = _json_alternatives(content)
+        if alternatives:
+            return alternatives
+    parser = make_parser(structured)
+    parser.feed(content)
+    parser.finish()
+    if parser.completed:
+        return parser.completed
+    # Neither format was followed: the whole reply is the one alternative
+    return [content.strip()] if content.strip() else []
+
+RECORD_RESPONSES_ENV = "LEXIA_RECORD_RESPONSES"
+
+def recording_path():
+    """Where raw responses are being recorded, or None"""
+    return os.environ.get(RECORD_RESPONSES_ENV) or None
+
+def record_response(path, model, structured, num_alternatives, content):
+    """Append a raw response to a corpus file (one JSON object per line)"""
+    record = {"model": model, "structured": structured, "alternatives": num_alternatives, "content": content}
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"Error recording response: {e}")
@@ -0,0 +1,185 @@
+"""
+Rewrite result cache for Lexia
+
+A bounded in-memory LRU sits in front of a SQLite file so repeated rewrites of
+the same text (sign-offs, templates) skip the API round trip. Entries are
+content-addressed by the normalized text and every option that affects the
+output, expire after a TTL, and are evicted oldest-first when size caps are hit.
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_FILE = "rewrite_cache.db"
+MEMORY_MAX_ENTRIES = 128
+DISK_MAX_ENTRIES = 5000
+DISK_MAX_BYTES = 20 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+_HORIZONTAL_SPACE_RE = re.compile(r'[ \t ]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+def _normalize_line(line):
+    # Indentation is kept as is: it is meaningful in code, nested lists and quotes
+    body = line.lstrip(' \t\u00a0')
+    if not body:
+        return ''
+    return line[:len(line) - len(body)] + _HORIZONTAL_SPACE_RE.sub(' ', body).rstrip()
+
+def normalize_text(text):
+    """Normalize whitespace so trivially different copies of a selection share a key"""
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    lines = [_normalize_line(line) for line in text.split('\n')]
+    return _BLANK_LINES_RE.sub('\n\n', '\n'.join(lines)).strip('\n')
+
+def make_cache_key(text, tone, model, temperature, num_alternatives, prompt=""):
+    """Build the content address for a rewrite request.
+
+    prompt fingerprints how the request is prompted (templates, output format,
+    generation mode), so editing those doesn't keep serving old results.
+    """
+    payload = json.dumps([normalize_text(text), tone, model, round(float(temperature), 3), int(num_alternatives),
+                          prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class RewriteCache:
+    def __init__(self, path=CACHE_FILE, memory_max_entries=MEMORY_MAX_ENTRIES, disk_max_entries=DISK_MAX_ENTRIES,
+                 disk_max_bytes=DISK_MAX_BYTES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.memory_max_entries = memory_max_entries
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0,
+                       "disk_evictions": 0, "expired": 0}
+
+    def _connection(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS rewrites (
+                key TEXT PRIMARY KEY,
+                alternatives TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS rewrites_accessed ON rewrites (accessed_at)")
+            self._db.commit()
+        return self._db
+
+    def _remember(self, key, alternatives, created_at):
+        self._memory[key] = (alternatives, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_max_entries:
+            self._memory.popitem(last=False)
+            self._stats["memory_evictions"] += 1
+
+    def get(self, key):
+        """Get cached alternatives for a key, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                alternatives, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return list(alternatives)
+                del self._memory[key]
+
+            try:
+                db = self._connection()
+                row = db.execute("SELECT alternatives, created_at FROM rewrites WHERE key = ?", (key,)).fetchone()
+                if row is not None and now - row[1] > self.ttl_seconds:
+                    db.execute("DELETE FROM rewrites WHERE key = ?", (key,))
+                    db.commit()
+                    self._stats["expired"] += 1
+                    row = None
+                if row is not None:
+                    db.execute("UPDATE rewrites SET accessed_at = ? WHERE key = ?", (now, key))
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"Error reading rewrite cache: {e}")
+                row = None
+
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+
+            alternatives = tuple(json.loads(row[0]))
+            self._remember(key, alternatives, row[1])
+            self._stats["disk_hits"] += 1
+            return list(alternatives)
+
+    def put(self, key, alternatives):
+        """Store alternatives for a key in both tiers"""
+        now = time.time()
+        alternatives = tuple(alternatives)
+        encoded = json.dumps(alternatives, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, alternatives, now)
+            try:
+                db = self._connection()
+                db.execute("INSERT OR REPLACE INTO rewrites (key, alternatives, size, created_at, accessed_at) "
+                           "VALUES (?, ?, ?, ?, ?)", (key, encoded, len(encoded.encode('utf-8')), now, now))
+                self._evict(db, now)
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Error writing rewrite cache: {e}")
+
+    def _evict(self, db, now):
+        expired = db.execute("DELETE FROM rewrites WHERE created_at < ?", (now - self.ttl_seconds,)).rowcount
+        self._stats["expired"] += max(expired, 0)
+
+        count, total_size = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM rewrites").fetchone()
+        if count <= self.disk_max_entries and total_size <= self.disk_max_bytes:
+            return
+        # Walk entries least-recently-used first until both caps are satisfied
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM rewrites ORDER BY accessed_at"):
+            if count <= self.disk_max_entries and total_size <= self.disk_max_bytes:
+                break
+            victims.append((key,))
+            count -= 1
+            total_size -= size
+        db.executemany("DELETE FROM rewrites WHERE key = ?", victims)
+        self._stats["disk_evictions"] += len(victims)
+
+    def clear(self):
+        """Drop every cached rewrite"""
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._connection()
+                db.execute("DELETE FROM rewrites")
+                db.commit()
+            except sqlite3.Error as e:
+                print(f"Error clearing rewrite cache: {e}")
+
+    def stats(self):
+        """Get hit/miss/eviction counters"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache(ttl_seconds=DEFAULT_TTL_SECONDS):
+    """Get the process-wide rewrite cache"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = RewriteCache(ttl_seconds=ttl_seconds)
+        else:
+            _cache.ttl_seconds = ttl_seconds
+        return _cache
@@ -0,0 +1,59 @@
+"""
+Rewrite job tracking for Lexia
+
+Each rewrite started from the popup is a RewriteJob wrapping the future of its
+request on the rewrite engine. Starting a new job cancels the one it
+supersedes (which aborts its HTTP stream), and generation numbers let callers
+drop late results from stale jobs.
+"""
+
+import threading
+
+class RewriteJob:
+    def __init__(self, generation):
+        self.generation = generation
+        self.future = None
+        self._cancelled = False
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+        if self.future is not None:
+            self.future.cancel()
+
+class RewriteJobSlot:
+    """Holds the single current rewrite job of a popup"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._current = None
+
+    def start(self, submit):
+        """Cancel the current job and start a new one; submit(job) must return its Future"""
+        with self._lock:
+            if self._current is not None:
+                self._current.cancel()
+            self._generation += 1
+            job = RewriteJob(self._generation)
+            self._current = job
+        job.future = submit(job)
+        # Superseded while submitting: cancel() ran before there was a future to cancel
+        if job.cancelled:
+            job.future.cancel()
+        return job
+
+    def is_current(self, job):
+        """Whether results from job may still be shown"""
+        with self._lock:
+            return job is self._current and not job.cancelled
+
+    def cancel_all(self):
+        """Cancel whatever is still running, e.g. when the popup closes"""
+        with self._lock:
+            if self._current is not None:
+                self._current.cancel()
+            self._current = None
@@ -1,130 +1,880 @@
-from openai import OpenAI
-from settings import get_api_keys, load_settings
+import asyncio
+import concurrent.futures
+import random
+import threading
+import time
+from collections import deque
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from settings import get_api_keys, get_settings, add_key_change_listener
+from rewrite_cache import get_cache, make_cache_key
+from engine import get_engine
+from chunking import estimate_tokens, split_into_chunks, stitch
+from tokens import count_tokens, count_message_tokens, max_output_tokens, context_window, MIN_OUTPUT_TOKENS
+from ratelimit import get_scheduler, parse_retry_after, wait_listener, background_work
+from prompts import build_messages, build_single_messages, prompt_fingerprint
+from response_parser import make_parser, parse_alternatives, recording_path, record_response
+
+PROVIDER_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "groq": "https://api.groq.com/openai/v1"
+}
+
+# Whether the provider honours the `n` parameter (several choices from one request)
+PROVIDER_SUPPORTS_N = {
+    "openai": True,
+    "groq": False
+}
+
+# Models whose API has a JSON mode, so alternatives can be requested as {"alternatives": [...]}
+# (the base gpt-4 model rejects response_format and keeps the separator format). Groq's JSON
+# mode doesn't support streaming, so only non-streamed requests use it.
+JSON_MODE_MODELS = {"llama-4-scout"}
+
+# Model the other provider races against when hedging
+HEDGE_PARTNERS = {
+    "gpt-4": "llama-4-scout",
+    "llama-4-scout": "gpt-4"
+}
+
+# Hedge after a provider's observed p90 time-to-first-token, within these bounds (seconds)
+HEDGE_DEFAULT_THRESHOLD = 1.5
+HEDGE_MIN_THRESHOLD = 0.25
+HEDGE_MAX_THRESHOLD = 5.0
+HEDGE_MIN_SAMPLES = 5
+TTFB_WINDOW = 50
+# Requests held longer than this by the scheduler (queue, pacing, 429 backoff) don't count as
+# time-to-first-token samples and aren't hedged: their latency is the scheduler's, not the provider's
+QUEUE_WAIT_TOLERANCE = 0.01
+
+# Keep idle connections around long enough to survive the gap between hotkey presses,
+# with room for dozens of concurrent rewrites, prefetches and streams on the engine loop
+CONNECTION_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=20, keepalive_expiry=120.0)
+
+# Retries for rate limits and transient failures (the SDK's own retries are off so the scheduler sees them)
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+
+# Long-lived clients keyed by (provider, base_url, api_key)
+_clients = {}
+_clients_lock = threading.Lock()
+_connection_stats = {"opened": 0, "reused": 0, "clients_created": 0}
+
+# Recent time-to-first-token samples per provider
+_ttfb_samples = {provider: deque(maxlen=TTFB_WINDOW) for provider in PROVIDER_BASE_URLS}
+_ttfb_lock = threading.Lock()
+
+# Models whose provider rejected response_format this session; they use the text format from then on
+_json_mode_rejected = set()
+
+# Prefetches in flight by cache key, so a foreground request for the same result waits for it
+# instead of paying for it twice. Each future gets the alternatives, or None if the prefetch
+# failed or was cancelled (engine loop only).
+_prefetches = {}
+
+# Prompt tokens reported per provider and how many of them hit the provider's prompt cache
+# (updated on the engine loop only)
+_prompt_cache_stats = {provider: {"responses": 0, "prompt_tokens": 0, "cached_tokens": 0}
+                       for provider in PROVIDER_BASE_URLS}
+
+def _count_connections(http_client):
+    """Attach hooks that record whether each request opened a new connection or reused one"""
+    async def on_request(request):
+        opened = []
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                opened.append(True)
+
+        request.extensions["trace"] = trace
+        request.extensions["lexia_opened"] = opened
+
+    async def on_response(response):
+        opened = response.request.extensions.get("lexia_opened")
+        if opened is None:
+            return
+        with _clients_lock:
+            if opened:
+                _connection_stats["opened"] += 1
+            else:
+                _connection_stats["reused"] += 1
+
+    http_client.event_hooks["request"].append(on_request)
+    http_client.event_hooks["response"].append(on_response)
+    return http_client
+
+def _follow_rate_limits(http_client, provider):
+    """Feed every response's rate-limit headers to the provider's scheduler"""
+    async def on_response(response):
+        get_scheduler(provider).note_headers(response.headers)
+
+    http_client.event_hooks["response"].append(on_response)
+    return http_client
+
+def get_client(provider):
+    """Get the pooled API client for a provider, creating it on first use.
+
+    Clients are AsyncOpenAI instances whose connection pool belongs to the
+    engine loop, so they must only be awaited there.
+    """
+    api_key = get_api_keys().get(provider)
+    if not api_key:
+        return None
+
+    base_url = PROVIDER_BASE_URLS[provider]
+    key = (provider, base_url, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+
+    try:
+        http_client = _follow_rate_limits(_count_connections(DefaultAsyncHttpxClient(limits=CONNECTION_LIMITS)),
+                                          provider)
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+    except Exception as e:
+        print(f"Error initializing {provider} client: {e}")
+        return None
+
+    with _clients_lock:
+        # Another thread may have raced us here; keep whichever client landed first
+        existing = _clients.setdefault(key, client)
+        if existing is client:
+            _connection_stats["clients_created"] += 1
+    if existing is not client:
+        get_engine().submit(client.close())
+    return existing
+
+def invalidate_clients(providers=None):
+    """Close and drop pooled clients, optionally only for the given providers"""
+    with _clients_lock:
+        stale = [key for key in _clients if providers is None or key[0] in providers]
+        clients = [_clients.pop(key) for key in stale]
+    for client in clients:
+        # The pool belongs to the engine loop, so close it there
+        future = get_engine().submit(client.close())
+        future.add_done_callback(_report_close_error)
+
+def _report_close_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"Error closing API client: {future.exception()}")
+
+def get_connection_stats():
+    """Get counts of newly opened vs. reused HTTP connections"""
+    with _clients_lock:
+        return dict(_connection_stats)
 
 def get_clients():
     """Get API clients based on current settings"""
-    keys = get_api_keys()
-    
-    openai_client = None
-    groq_client = None
-    
-    if keys["openai"]:
+    return get_client("openai"), get_client("groq")
+
+add_key_change_listener(invalidate_clients)
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def record_ttfb(provider, seconds):
+    """Record how long a provider took to produce its first token"""
+    with _ttfb_lock:
+        _ttfb_samples[provider].append(seconds)
+
+def hedge_threshold(provider):
+    """How long to wait for a first token before hedging to the other provider"""
+    with _ttfb_lock:
+        samples = list(_ttfb_samples[provider])
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_THRESHOLD
+    return min(HEDGE_MAX_THRESHOLD, max(HEDGE_MIN_THRESHOLD, _percentile(samples, 0.9)))
+
+def get_ttfb_stats():
+    """Get p50/p90 time-to-first-token per provider from recent requests"""
+    with _ttfb_lock:
+        snapshot = {provider: list(samples) for provider, samples in _ttfb_samples.items()}
+    return {provider: {"count": len(samples),
+                       "p50": _percentile(samples, 0.5) if samples else None,
+                       "p90": _percentile(samples, 0.9) if samples else None}
+            for provider, samples in snapshot.items()}
+
+class RewriteCancelled(Exception):
+    """Raised by the blocking wrapper when its rewrite was cancelled"""
+
+def _usage_value(usage, field):
+    value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+    return value or 0
+
+def _add_usage(stats, usage, provider=None):
+    """Add a response's token usage (an API usage object or a dict) to stats["usage"].
+
+    Prompt tokens served from the provider's prompt cache are taken from
+    usage.prompt_tokens_details.cached_tokens; given the provider, the
+    response also counts towards get_prompt_cache_stats().
+    """
+    if not usage:
+        return
+    details = _usage_value(usage, "prompt_tokens_details")
+    cached_tokens = _usage_value(details, "cached_tokens") if details else _usage_value(usage, "cached_tokens")
+    if provider is not None:
+        counts = _prompt_cache_stats[provider]
+        counts["responses"] += 1
+        counts["prompt_tokens"] += _usage_value(usage, "prompt_tokens")
+        counts["cached_tokens"] += cached_tokens
+    if stats is None:
+        return
+    total = stats.setdefault("usage", {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0})
+    total["prompt_tokens"] += _usage_value(usage, "prompt_tokens")
+    total["completion_tokens"] += _usage_value(usage, "completion_tokens")
+    total["cached_tokens"] += cached_tokens
+
+def get_prompt_cache_stats():
+    """Get prompt tokens sent and served from the provider's prompt cache since startup, per provider"""
+    return {provider: dict(counts, ratio=counts["cached_tokens"] / counts["prompt_tokens"] if counts["prompt_tokens"] else None)
+            for provider, counts in _prompt_cache_stats.items()}
+
+def _request_cost(request):
+    """Tokens a request counts against tokens/min: its prompt plus the most it may generate"""
+    return count_message_tokens(request["messages"]) + request.get("max_tokens", 0) * request.get("n", 1)
+
+def _retry_delay(error, attempt):
+    retry_after = parse_retry_after(getattr(getattr(error, "response", None), "headers", None))
+    if retry_after is not None:
+        # A little jitter so queued requests don't all retry at the same instant
+        return retry_after + random.uniform(0, 0.1 + 0.1 * retry_after)
+    backoff = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+async def _create_completion(client, provider, request, on_sent=None, **kwargs):
+    """Send a chat completion through the provider's scheduler, retrying rate limits and transient failures.
+
+    Callers hold one of the provider's concurrency slots around this and any
+    streaming of the response. on_sent(waited) is called as each attempt
+    goes out, with the seconds spent waiting on the scheduler and backoff so far.
+    """
+    scheduler = get_scheduler(provider)
+    cost = _request_cost(request)
+    waited = 0.0
+    for attempt in range(RETRY_ATTEMPTS):
+        waited += await scheduler.take(cost)
+        if on_sent:
+            on_sent(waited)
         try:
-            openai_client = OpenAI(api_key=keys["openai"])
-        except Exception as e:
-            print(f"Error initializing OpenAI client: {e}")
-    
-    if keys["groq"]:
+            return await client.chat.completions.create(**kwargs, **request)
+        except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            # An exhausted quota won't come back by waiting
+            if attempt == RETRY_ATTEMPTS - 1 or getattr(e, "code", None) == "insufficient_quota":
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"{provider} request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            if isinstance(e, openai.RateLimitError):
+                # Everything queued for this provider waits it out too
+                scheduler.block_for(delay)
+            else:
+                await asyncio.sleep(delay)
+                waited += delay
+
+async def _stream_alternatives(client, request, model, num_alternatives, on_text, on_alternative, on_first_token=None,
+                               stats=None, on_sent=None):
+    """Stream a completion, reporting partial text and each alternative as it completes.
+
+    If stats is given, stats["parse"] receives the seconds spent parsing and
+    stats["usage"] the token usage reported at the end of the stream.
+    on_sent(waited) is called when the request goes out, with the seconds it
+    waited for a concurrency slot and on the scheduler.
+    """
+    parser = make_parser("response_format" in request)
+    parse_time = 0.0
+    received = False
+    record_path = recording_path()
+    recorded = [] if record_path else None
+
+    def report(newly_completed):
+        first_index = len(parser.completed) - len(newly_completed)
+        for offset, alt in enumerate(newly_completed):
+            if on_alternative and first_index + offset < num_alternatives:
+                on_alternative(first_index + offset, alt)
+
+    provider = _provider_for(model)
+    slot_started = time.perf_counter()
+    async with get_scheduler(provider).slot():
+        slot_wait = time.perf_counter() - slot_started
+
+        def sent(waited):
+            if on_sent:
+                on_sent(slot_wait + waited)
+
+        stream = await _create_completion(client, provider, request, on_sent=sent, stream=True,
+                                          stream_options={"include_usage": True})
         try:
-            groq_client = OpenAI(
-                api_key=keys["groq"],
-                base_url="https://api.groq.com/openai/v1"
-            )
-        except Exception as e:
-            print(f"Error initializing Groq client: {e}")
-    
-    return openai_client, groq_client
+            async for chunk in stream:
+                if not chunk.choices:
+                    # The final chunk carries only the usage
+                    _add_usage(stats, getattr(chunk, "usage", None), provider)
+                    continue
+                if chunk.choices[0].finish_reason == "length" and stats is not None:
+                    stats["truncated"] = True
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                if on_first_token and not received:
+                    on_first_token()
+                received = True
+                if recorded is not None:
+                    recorded.append(delta)
+                parse_started = time.perf_counter()
+                newly_completed = parser.feed(delta)
+                parse_time += time.perf_counter() - parse_started
+                report(newly_completed)
+                if on_text and len(parser.completed) < num_alternatives:
+                    on_text(len(parser.completed), parser.current)
+        finally:
+            # Also runs on cancellation, aborting the HTTP response
+            await stream.close()
+    if recorded is not None:
+        record_response(record_path, model, "response_format" in request, num_alternatives, "".join(recorded))
+    parse_started = time.perf_counter()
+    newly_completed = parser.finish()
+    alternatives = parser.completed
+    parse_time += time.perf_counter() - parse_started
+    if stats is not None:
+        stats["parse"] = parse_time
+    report(newly_completed)
+    return alternatives
+
+async def _stream_choices(client, provider, request, on_alternative, stats=None):
+    """Stream a multi-choice (`n`) completion, reporting each choice as soon as it finishes"""
+    buffers = {}
+    finished = []
+    async with get_scheduler(provider).slot():
+        stream = await _create_completion(client, provider, request, stream=True, stream_options={"include_usage": True})
+        try:
+            async for chunk in stream:
+                _add_usage(stats, getattr(chunk, "usage", None), provider)
+                for choice in chunk.choices:
+                    if choice.delta and choice.delta.content:
+                        buffers[choice.index] = buffers.get(choice.index, "") + choice.delta.content
+                    if choice.finish_reason:
+                        text = buffers.pop(choice.index, "").strip()
+                        if text:
+                            finished.append(text)
+                            if on_alternative:
+                                on_alternative(len(finished) - 1, text)
+        finally:
+            await stream.close()
+    # Choices the stream ended without a finish_reason for
+    for index in sorted(buffers):
+        text = buffers[index].strip()
+        if text:
+            finished.append(text)
+            if on_alternative:
+                on_alternative(len(finished) - 1, text)
+    return finished
+
+def _fan_out_temperatures(temperature, count):
+    """Spread sampling temperatures so parallel requests don't all return the same rewrite"""
+    return [min(1.0, temperature + 0.1 * i) for i in range(count)]
+
+async def _complete_text(client, provider, request, stats=None):
+    async with get_scheduler(provider).slot():
+        response = await _create_completion(client, provider, request)
+    _add_usage(stats, response.usage, provider)
+    return response.choices[0].message.content.strip()
+
+async def _fan_out_alternatives(client, provider, request, num_alternatives, on_alternative, stats=None):
+    """Generate each alternative as its own completion, concurrently"""
+    if PROVIDER_SUPPORTS_N[provider]:
+        return await _stream_choices(client, provider, dict(request, n=num_alternatives), on_alternative, stats)
+
+    alternatives = []
+    errors = []
+    temperatures = _fan_out_temperatures(request["temperature"], num_alternatives)
+    tasks = [asyncio.ensure_future(_complete_text(client, provider, dict(request, temperature=t), stats)) for t in temperatures]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                text = await next_done
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors.append(e)
+                continue
+            if text:
+                alternatives.append(text)
+                if on_alternative:
+                    on_alternative(len(alternatives) - 1, text)
+    finally:
+        # Don't leave requests nobody needs running after a cancellation
+        for task in tasks:
+            task.cancel()
+    if not alternatives and errors:
+        raise errors[0]
+    return alternatives
+
+def _provider_for(model):
+    return "groq" if model == "llama-4-scout" else "openai"
 
-def rewrite_text_with_gpt(original_text: str, tone: str = "Neutral", num_alternatives: int = None, model_override: str = None) -> list[str]:
-    settings = load_settings()
+def _cache_key(original_text, tone, model, temperature, num_alternatives, parallel):
+    """Cache key for a rewrite, including how it is prompted under the current settings"""
+    json_mode = model in JSON_MODE_MODELS and get_settings().get("structured_output", True)
+    return make_cache_key(original_text, tone, model, temperature, num_alternatives,
+                          prompt_fingerprint(model, json_mode, parallel))
+
+def _prepare_request(model, original_text, tone, num_alternatives, temperature, json_mode=False):
+    """Get the client and request body for a model, or None if its API key is missing.
+
+    json_mode asks models that have one for a JSON object; only pass it for
+    requests that aren't streamed.
+    """
+    provider = _provider_for(model)
+    client = get_client(provider)
+    if not client:
+        return None
+    # Select the actual model name for the provider
+    if model == "llama-4-scout":
+        actual_model = "meta-llama/llama-4-scout-17b-16e-instruct"
+    else:
+        actual_model = model
+    structured = (json_mode and model in JSON_MODE_MODELS and model not in _json_mode_rejected
+                  and get_settings().get("structured_output", True))
+    request = {
+        "model": actual_model,
+        "messages": build_messages(original_text, tone, num_alternatives, model, structured),
+        "temperature": temperature
+    }
+    if structured:
+        request["response_format"] = {"type": "json_object"}
+    return client, request
+
+def _rejects_json_mode(error, request):
+    """Whether a failed request was refused because of its response_format"""
+    if "response_format" not in request or not isinstance(error, openai.BadRequestError):
+        return False
+    message = str(error).lower()
+    return getattr(error, "param", None) == "response_format" or "response_format" in message or "json" in message
+
+def _use_text_format(request, model, original_text, tone, num_alternatives):
+    """Turn a JSON mode request into one asking for the model's text format"""
+    request.pop("response_format", None)
+    request["messages"] = build_messages(original_text, tone, num_alternatives, model)
+
+async def _complete_alternatives(client, provider, request, model, original_text, tone, num_alternatives, stats):
+    """Non-streamed rewrite, falling back to the text format if the provider refuses JSON mode"""
+    try:
+        async with get_scheduler(provider).slot():
+            return await _create_completion(client, provider, request)
+    except openai.BadRequestError as e:
+        if not _rejects_json_mode(e, request):
+            raise
+        print(f"{model} rejected JSON mode ({e}); using the text format")
+        _json_mode_rejected.add(model)
+        _use_text_format(request, model, original_text, tone, num_alternatives)
+        # The text format's prompt differs in size
+        _size_request(request, model, original_text, tone, num_alternatives, stats)
+        async with get_scheduler(provider).slot():
+            return await _create_completion(client, provider, request)
+
+def _size_request(request, model, original_text, tone, alternatives_per_request, stats):
+    """Set max_tokens from the input size; returns an error message if the prompt can't fit the model's context"""
+    prompt_tokens = count_message_tokens(request["messages"])
+    max_tokens = max_output_tokens(count_tokens(original_text), alternatives_per_request, tone)
+    limit = context_window(model)
+    if limit is not None:
+        available = limit - prompt_tokens
+        if available < MIN_OUTPUT_TOKENS:
+            return (f"Error: The text is too long for {model} (about {prompt_tokens} prompt tokens, "
+                    f"context window {limit}). Select less text.")
+        if max_tokens > available:
+            print(f"Warning: {model} only has room for {available} of the {max_tokens} output tokens "
+                  f"this rewrite may need; alternatives may be cut short")
+            max_tokens = available
+    request["max_tokens"] = max_tokens
+    stats.update(prompt_tokens_estimate=prompt_tokens, max_tokens=max_tokens)
+    return None
+
+def _queued(waited):
+    """Whether a request's latency was the scheduler's rather than the provider's"""
+    return waited > QUEUE_WAIT_TOLERANCE or background_work.get()
+
+async def _timed_stream(model, client, request, num_alternatives, on_text, on_alternative, stats):
+    """Stream a single-provider rewrite, recording its time-to-first-token from when the request went out"""
+    provider = _provider_for(model)
+    sent = {"at": time.perf_counter(), "waited": 0.0}
+
+    def on_sent(waited):
+        sent.update(at=time.perf_counter(), waited=waited)
+
+    def first_token():
+        ttfb = time.perf_counter() - sent["at"]
+        if not _queued(sent["waited"]):
+            record_ttfb(provider, ttfb)
+        stats.update(provider=provider, model=model, ttfb=ttfb, queue_wait=sent["waited"])
+
+    return await _stream_alternatives(client, request, model, num_alternatives, on_text, on_alternative, first_token,
+                                      stats, on_sent)
+
+async def _hedged_stream(model, prepared, partner_prepared, num_alternatives, on_text, on_alternative, stats):
+    """Race the primary provider against its hedge partner on time-to-first-token.
+
+    The partner only starts if the primary has produced nothing within the
+    primary's adaptive threshold of being sent (or has already failed); a
+    primary that had to wait on the scheduler first isn't hedged, since the
+    partner would only spend its own quota on a rate limit. The first attempt to
+    produce a token wins and is streamed to the callbacks; the other attempt is
+    cancelled as soon as its own first token arrives, which is when its latency
+    is known, or when the winner finishes.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    decided = asyncio.Event()
+    state = {"winner": None}
+    attempts = {}
+
+    def launch(attempt_model, client, request):
+        attempt = {"model": attempt_model, "provider": _provider_for(attempt_model), "ttfb": None, "waited": 0.0,
+                   "sent": asyncio.Event()}
+
+        def sent(waited):
+            attempt.update(started=loop.time(), waited=waited)
+            attempt["sent"].set()
+
+        def first_token():
+            attempt["ttfb"] = loop.time() - started
+            if not _queued(attempt["waited"]):
+                record_ttfb(attempt["provider"], loop.time() - attempt["started"])
+            if state["winner"] is None:
+                state["winner"] = attempt
+                decided.set()
+            else:
+                # Its latency is all we wanted from the loser
+                attempt["task"].cancel()
+
+        def forward_text(index, text):
+            if state["winner"] is attempt and on_text:
+                on_text(index, text)
+
+        def forward_alternative(index, text):
+            if state["winner"] is attempt and on_alternative:
+                on_alternative(index, text)
+
+        attempt["started"] = loop.time()
+        attempt["task"] = asyncio.ensure_future(_stream_alternatives(
+            client, request, attempt_model, num_alternatives, forward_text, forward_alternative, first_token,
+            attempt, sent))
+        attempts[attempt_model] = attempt
+        return attempt
+
+    primary = launch(model, *prepared)
+    threshold = hedge_threshold(primary["provider"])
+    decided_waiter = asyncio.ensure_future(decided.wait())
+    sent_waiter = asyncio.ensure_future(primary["sent"].wait())
+    try:
+        # The threshold runs from when the request goes out, not from when it was queued
+        await asyncio.wait({primary["task"], sent_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if primary["sent"].is_set() and not _queued(primary["waited"]):
+            await asyncio.wait({primary["task"], decided_waiter}, timeout=threshold,
+                               return_when=asyncio.FIRST_COMPLETED)
+        else:
+            # Queued behind the scheduler: racing the partner would only spend its quota too
+            await asyncio.wait({primary["task"], decided_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        hedged = state["winner"] is None and not _queued(primary["waited"])
+        if hedged:
+            launch(HEDGE_PARTNERS[model], *partner_prepared)
+            pending = {attempt["task"] for attempt in attempts.values()}
+            # Wait for a first token, or for every attempt to have failed
+            while state["winner"] is None and pending:
+                done, pending = await asyncio.wait(pending | {decided_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                pending.discard(decided_waiter)
+        if state["winner"] is None:
+            # Nobody produced a token; surface the primary's error
+            return await primary["task"]
+
+        winner = state["winner"]
+        alternatives = await winner["task"]
+    finally:
+        decided_waiter.cancel()
+        sent_waiter.cancel()
+        for attempt in attempts.values():
+            attempt["task"].cancel()
+
+    stats.update(provider=winner["provider"], model=winner["model"], ttfb=winner["ttfb"], parse=winner.get("parse"),
+                 usage=winner.get("usage"), truncated=winner.get("truncated", False), hedged=hedged, hedge_threshold=threshold, winner=winner["provider"],
+                 queue_wait=winner["waited"])
+    if hedged and primary["ttfb"] is None and primary["sent"].is_set():
+        # A censored sample: the primary took at least this long, which the threshold should learn from
+        record_ttfb(primary["provider"], loop.time() - primary["started"])
+    if hedged:
+        loser = next((a for a in attempts.values() if a is not winner), None)
+        if loser is not None and loser["ttfb"] is not None:
+            stats.update(hedge_saved=loser["ttfb"] - winner["ttfb"], hedge_saved_is_lower_bound=False)
+        elif winner is not primary:
+            # The primary never answered, so it would have taken at least this much longer
+            stats.update(hedge_saved=loop.time() - started - winner["ttfb"], hedge_saved_is_lower_bound=True)
+    return alternatives
+
+async def _rewrite_chunks(original_text, tone, num_alternatives, model, max_tokens, max_parallel, force_fresh,
+                          on_text, on_progress, stats):
+    """Rewrite a long text chunk by chunk with bounded concurrency and stitch each alternative back together"""
+    chunks = split_into_chunks(original_text, max_tokens)
+    results = [None] * len(chunks)
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def rewrite_chunk(index):
+        if not chunks[index].text:
+            return index, [""] * num_alternatives
+        async with semaphore:
+            # Each chunk is an ordinary rewrite, so it is cached on its own too
+            chunk_stats = {}
+            alternatives = await rewrite_async(chunks[index].text, tone, num_alternatives, model_override=model,
+                                               force_fresh=force_fresh, stats=chunk_stats)
+        _add_usage(stats, chunk_stats.get("usage"))
+        if chunk_stats.get("truncated"):
+            stats["truncated"] = True
+        for key in ("prompt_tokens_estimate", "max_tokens"):
+            if chunk_stats.get(key) is not None:
+                stats[key] = stats.get(key, 0) + chunk_stats[key]
+        return index, alternatives
+
+    stats.update(provider=_provider_for(model), model=model, hedged=False, chunks=len(chunks))
+    if on_progress:
+        on_progress(0, len(chunks))
+    tasks = [asyncio.ensure_future(rewrite_chunk(index)) for index in range(len(chunks))]
+    completed = 0
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            index, alternatives = await next_done
+            if alternatives[0].startswith("Error:"):
+                return [f"Error: part {index + 1} of {len(chunks)} failed: {alternatives[0][len('Error: '):]}"]
+            results[index] = alternatives
+            completed += 1
+            if on_progress:
+                on_progress(completed, len(chunks))
+            if on_text:
+                # Show the first alternative up to the first part that is still missing
+                ready = 0
+                while ready < len(results) and results[ready] is not None:
+                    ready += 1
+                if ready:
+                    on_text(0, stitch(chunks[:ready], [result[0] for result in results[:ready]]).strip())
+    finally:
+        for task in tasks:
+            task.cancel()
+    return [stitch(chunks, [result[i] for result in results]) for i in range(num_alternatives)]
+
+async def rewrite_async(original_text: str, tone: str = "Neutral", num_alternatives: int = None, model_override: str = None,
+                        on_text=None, on_alternative=None, force_fresh=False, stats=None, on_progress=None,
+                        on_wait=None) -> list[str]:
+    """Rewrite text into alternatives on the engine loop.
+
+    When on_text/on_alternative callbacks are given and streaming is enabled, the
+    response is streamed: on_text(index, partial_text) fires as tokens arrive and
+    on_alternative(index, text) fires as soon as each alternative is complete.
+
+    With generation_mode set to "parallel", each alternative is generated by its
+    own completion (the `n` parameter where supported, otherwise concurrent
+    requests) and on_alternative fires in completion order.
+
+    Results are cached by text, tone, model, temperature, count and the prompt
+    templates and format the settings select (a hedged rewrite under both
+    models); force_fresh
+    skips the lookup (a re-roll) but still stores the new result.
+
+    With hedge_requests enabled and both API keys set, a streamed rewrite whose
+    provider is slow to produce a first token is raced against the other
+    provider; whichever answers first wins. Pass a dict as stats to receive the
+    provider/model that answered, whether it came from the cache, seconds spent
+    on client setup, time-to-first-token and parsing and, when hedged, how much
+    latency the hedge saved.
+
+    Texts longer than chunk_threshold_tokens are split on paragraph/sentence
+    boundaries into chunks of at most chunk_max_tokens, rewritten with up to
+    max_parallel_chunks in flight, and stitched back together per alternative
+    with the original whitespace. on_progress(done, total) reports finished
+    chunks and on_text shows the first alternative as its leading parts land.
+
+    Every request gets a max_tokens sized from the input length, the number of
+    alternatives and the tone; prompts that can't fit the model's context
+    window are refused before sending. stats receives the estimated prompt
+    tokens, the max_tokens used, the usage the API reported and whether the
+    output was cut short by max_tokens.
+
+    Requests go through a per-provider scheduler (see ratelimit.py) that paces
+    them to the provider's limits and retries 429s and transient failures with
+    jittered backoff honouring Retry-After. on_wait(provider, seconds, reason,
+    queued) reports when this rewrite is held in that queue.
+
+    Callbacks run on the engine thread. Cancelling the task aborts the request.
+    """
+    if stats is None:
+        stats = {}
+    if on_wait is not None:
+        # Seen by the scheduler in this task and in any chunk tasks it starts
+        wait_listener.set(on_wait)
+    settings = get_settings()
     if num_alternatives is None:
         num_alternatives = settings.get("num_alternatives", 3)
     model = model_override if model_override else settings.get("model", "gpt-4")
     temperature = settings.get("temperature", 0.7)
+    stream = settings.get("stream_responses", True) and (on_text or on_alternative)
+    parallel = settings.get("generation_mode", "combined") == "parallel" and num_alternatives > 1
+    # Background work doesn't hedge: it isn't waited on, and a hedge spends the other provider's quota
+    hedge = (settings.get("hedge_requests", False) and not parallel and model in HEDGE_PARTNERS
+             and not background_work.get())
     
     if not original_text.strip():
         return ["No text provided."]
 
-    # Get API clients
-    openai_client, groq_client = get_clients()
-    
-    # Check if we have the required client for the selected model
-    if model == "llama-4-scout" and not groq_client:
-        return ["Error: Groq API key not configured. Please add your Groq API key in Settings → API Keys."]
-    elif model != "llama-4-scout" and not openai_client:
-        return ["Error: OpenAI API key not configured. Please add your OpenAI API key in Settings → API Keys."]
-
+    cache = None
     try:
-        # Determine if it's a preset tone or custom instruction
-        is_preset_tone = tone in ["Neutral", "Formal", "Friendly", "Professional", "Concise", "Creative"]
-        
-        if model == "llama-4-scout":
-            # Llama-specific prompt that works better with its format
-            if is_preset_tone:
-                system_prompt = f"You are a helpful assistant that rewrites text to improve grammar, clarity, and tone. Use a {tone.lower()} tone."
-            else:
-                system_prompt = f"You are a helpful assistant that rewrites text according to specific instructions. Follow the user's rewriting requirements precisely."
-            
-            user_prompt = f"""Rewrite the following text in {num_alternatives} different ways. Label each version clearly as 'Version 1:', 'Version 2:', etc.
+        # Building the key and prompts reads the template overrides in settings, so errors there
+        # come back as an error result like a failed request
+        if settings.get("cache_enabled", True):
+            cache = get_cache(ttl_seconds=settings.get("cache_ttl_hours", 168) * 3600)
+            cache_key = _cache_key(original_text, tone, model, temperature, num_alternatives, parallel)
+            cached = None if force_fresh else await asyncio.to_thread(cache.get, cache_key)
+            pending = None if force_fresh or background_work.get() else _prefetches.get(cache_key)
+            if not cached and pending is not None:
+                # Shielded: this request being cancelled mustn't cancel the prefetch
+                cached = await asyncio.shield(pending)
+                if cached:
+                    cached = list(cached)
+                    stats["prefetched"] = True
+            if cached:
+                stats.update(model=model, cached=True)
+                if on_alternative:
+                    for index, alt in enumerate(cached):
+                        on_alternative(index, alt)
+                return cached
 
-Original text: {original_text}
-
-{f"Rewriting instruction: {tone}" if not is_preset_tone else f"Use a {tone.lower()} tone."}
-
-Please provide exactly {num_alternatives} rewritten versions."""
-        else:
-            # GPT prompt with separator
-            if is_preset_tone:
-                system_prompt = f"You are a helpful assistant that rewrites text to improve grammar, clarity, and tone. Use a {tone.lower()} tone. Provide {num_alternatives} different alternative rewrites, each with a slightly different approach or style while maintaining the {tone.lower()} tone."
-            else:
-                system_prompt = f"You are a helpful assistant that rewrites text according to specific instructions. Follow the user's rewriting requirements precisely while providing {num_alternatives} different variations."
-            
-            user_prompt = f"""Rewrite the following text in {num_alternatives} different ways:
+        chunk_threshold = settings.get("chunk_threshold_tokens", 1500)
+        if estimate_tokens(original_text) > chunk_threshold:
+            alternatives = await _rewrite_chunks(original_text, tone, num_alternatives, model,
+                                                 min(chunk_threshold, settings.get("chunk_max_tokens", 800)),
+                                                 settings.get("max_parallel_chunks", 4), force_fresh,
+                                                 on_text, on_progress, stats)
+            if not alternatives[0].startswith("Error:"):
+                # A part cut short by max_tokens isn't worth keeping for the whole TTL
+                if cache is not None and not stats.get("truncated"):
+                    await asyncio.to_thread(cache.put, cache_key, alternatives)
+                if on_alternative:
+                    for index, alt in enumerate(alternatives):
+                        on_alternative(index, alt)
+            return alternatives
 
-{original_text}
+        # Only the client for the selected model is needed
+        provider = _provider_for(model)
+        # Hedged rewrites are always streamed
+        streamed = bool(stream) or hedge
+        client_started = time.perf_counter()
+        prepared = _prepare_request(model, original_text, tone, num_alternatives, temperature, json_mode=not streamed)
+        client_setup = time.perf_counter() - client_started
+        if prepared is None:
+            if provider == "groq":
+                return ["Error: Groq API key not configured. Please add your Groq API key in Settings → API Keys."]
+            return ["Error: OpenAI API key not configured. Please add your OpenAI API key in Settings → API Keys."]
+        client, request = prepared
+        stats.update(provider=provider, model=model, hedged=False, cached=False, client_setup=client_setup)
 
-{f"Rewriting instruction: {tone}" if not is_preset_tone else f"Use a {tone.lower()} tone."}
+        if parallel:
+            request["messages"] = build_single_messages(original_text, tone)
+            # Each request returns one plain rewrite
+            request.pop("response_format", None)
+        size_error = _size_request(request, model, original_text, tone, 1 if parallel else num_alternatives, stats)
+        if size_error:
+            return [size_error]
 
-Please provide {num_alternatives} alternatives, separated by '---ALTERNATIVE---' markers."""
+        # Hedging needs the partner's key too; without it this is a plain request
+        partner_prepared = None
+        if hedge:
+            partner_prepared = _prepare_request(HEDGE_PARTNERS[model], original_text, tone, num_alternatives,
+                                                temperature)
+            if partner_prepared is not None and _size_request(partner_prepared[1], HEDGE_PARTNERS[model], original_text,
+                                                              tone, num_alternatives, {}):
+                partner_prepared = None
 
-        # Select the appropriate client and model based on settings
-        if model == "llama-4-scout":
-            client = groq_client
-            actual_model = "meta-llama/llama-4-scout-17b-16e-instruct"
+        extra_cache_keys = []
+        if partner_prepared is not None:
+            alternatives = await _hedged_stream(model, prepared, partner_prepared, num_alternatives,
+                                                on_text, on_alternative, stats)
+            if stats["model"] != model and cache is not None:
+                # Cache under the model that actually answered too, so asking either model again hits
+                extra_cache_keys.append(_cache_key(original_text, tone, stats["model"], temperature, num_alternatives,
+                                                   parallel))
+        elif parallel:
+            alternatives = await _fan_out_alternatives(client, provider, request, num_alternatives, on_alternative,
+                                                       stats)
+        elif stream:
+            alternatives = await _timed_stream(model, client, request, num_alternatives, on_text, on_alternative, stats)
         else:
-            client = openai_client
-            actual_model = model
-        
-        response = client.chat.completions.create(
-            model=actual_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=temperature
-        )
-        
-        content = response.choices[0].message.content.strip()
-        
-        # Try to split by the expected separator first
-        alternatives = content.split('---ALTERNATIVE---')
-        alternatives = [alt.strip() for alt in alternatives if alt.strip()]
-        
-        # If we didn't get enough alternatives, try to parse Llama's format
-        if len(alternatives) < 2 and model == "llama-4-scout":
-            # Parse Llama's format with **Version X:** or similar patterns
-            import re
-            # Look for patterns like "Version 1:", "Alternative 1:", etc.
-            version_pattern = r'\*\*(?:Version|Alternative|Option)\s*\d+:.*?\*\*\s*(.*?)(?=\*\*(?:Version|Alternative|Option)\s*\d+:|$)'
-            matches = re.findall(version_pattern, content, re.DOTALL)
-            
-            if matches:
-                alternatives = [match.strip() for match in matches]
-            else:
-                # Fallback: split by double newlines if we have them
-                parts = content.split('\n\n')
-                if len(parts) >= num_alternatives:
-                    alternatives = parts[:num_alternatives]
-                else:
-                    # Last resort: just return the whole response as one alternative
-                    alternatives = [content]
+            response = await _complete_alternatives(client, provider, request, model, original_text, tone,
+                                                    num_alternatives, stats)
+            _add_usage(stats, response.usage, provider)
+            if response.choices[0].finish_reason == "length":
+                stats["truncated"] = True
+            content = response.choices[0].message.content.strip()
+            if recording_path():
+                record_response(recording_path(), model, "response_format" in request, num_alternatives, content)
+            parse_started = time.perf_counter()
+            alternatives = parse_alternatives(content, "response_format" in request)
+            stats["parse"] = time.perf_counter() - parse_started
         
         # Ensure we have the requested number of alternatives
         if len(alternatives) < num_alternatives:
             while len(alternatives) < num_alternatives:
                 alternatives.append(alternatives[0] if alternatives else original_text)
         
-        return alternatives[:num_alternatives]
+        alternatives = alternatives[:num_alternatives]
+        # A response cut short by max_tokens (possibly padded with copies) isn't worth keeping for the whole TTL
+        if cache is not None and not stats.get("truncated"):
+            for key in [cache_key] + extra_cache_keys:
+                await asyncio.to_thread(cache.put, key, alternatives)
+        return alternatives
 
     except Exception as e:
         return [f"Error: {str(e)}"]
+
+async def prefetch_async(original_text: str, tone: str, num_alternatives: int = None, model_override: str = None):
+    """Rewrite as background work so the result lands in the cache.
+
+    While it runs, a foreground rewrite_async for the same result waits for
+    it rather than sending the same request again.
+    """
+    settings = get_settings()
+    if num_alternatives is None:
+        num_alternatives = settings.get("num_alternatives", 3)
+    model = model_override if model_override else settings.get("model", "gpt-4")
+    parallel = settings.get("generation_mode", "combined") == "parallel" and num_alternatives > 1
+    cache_key = _cache_key(original_text, tone, model, settings.get("temperature", 0.7), num_alternatives, parallel)
+    if cache_key in _prefetches:
+        return await asyncio.shield(_prefetches[cache_key])
+    done = asyncio.get_running_loop().create_future()
+    _prefetches[cache_key] = done
+    alternatives = None
+    background_work.set(True)
+    try:
+        alternatives = await rewrite_async(original_text, tone, num_alternatives, model_override=model)
+        return alternatives
+    finally:
+        del _prefetches[cache_key]
+        failed = not alternatives or alternatives[0].startswith("Error:")
+        done.set_result(None if failed else alternatives)
+
+def submit_rewrite(original_text: str, tone: str = "Neutral", **kwargs) -> concurrent.futures.Future:
+    """Schedule a rewrite on the engine loop from any thread.
+
+    Takes the same arguments as rewrite_async; cancelling the returned future
+    cancels the rewrite.
+    """
+    return get_engine().submit(rewrite_async(original_text, tone, **kwargs))
+
+def rewrite_text_with_gpt(original_text: str, tone: str = "Neutral", num_alternatives: int = None, model_override: str = None,
+                          on_text=None, on_alternative=None, force_fresh=False) -> list[str]:
+    """Blocking wrapper around rewrite_async for callers outside the engine loop"""
+    if get_engine().in_engine_thread():
+        raise RuntimeError("rewrite_text_with_gpt would deadlock the engine loop; await rewrite_async instead")
+    future = submit_rewrite(original_text, tone, num_alternatives=num_alternatives, model_override=model_override,
+                            on_text=on_text, on_alternative=on_alternative, force_fresh=force_fresh)
+    try:
+        return future.result()
+    except concurrent.futures.CancelledError:
+        raise RewriteCancelled()
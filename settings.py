@@ -1,8 +1,9 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
 import json
 import os
 import base64
+import threading
+import time
+from types import MappingProxyType
 
 SETTINGS_FILE = "settings.json"
 DEFAULT_SETTINGS = {
@@ -10,18 +11,44 @@ DEFAULT_SETTINGS = {
     "model": "llama-4-scout",
     "temperature": 0.7,
     "num_alternatives": 3,
+    "stream_responses": True,
+    "generation_mode": "combined",
+    "structured_output": True,
+    "prompt_templates": {},
+    "cache_enabled": True,
+    "cache_ttl_hours": 168,
+    "prefetch_enabled": False,
+    "similar_reuse_enabled": True,
+    "similar_reuse_threshold": 0.6,
+    "prefetch_tones": 2,
+    "prefetch_other_model": True,
+    "prefetch_max_requests": 3,
+    "prefetch_max_tokens": 6000,
+    "hedge_requests": False,
+    "chunk_threshold_tokens": 1500,
+    "chunk_max_tokens": 800,
+    "max_parallel_chunks": 4,
+    "tracing_enabled": False,
+    "daemon_enabled": True,
+    "daemon_port": 47321,
     "openai_api_key": "",
     "groq_api_key": ""
 }
 
-def load_settings():
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return DEFAULT_SETTINGS.copy()
-    return DEFAULT_SETTINGS.copy()
+# Minimum seconds between checks of settings.json for external edits
+SETTINGS_CHECK_INTERVAL = 1.0
+
+_key_change_listeners = []
+
+# Parsed settings shared by the whole process, refreshed only when the file changes
+_settings_lock = threading.Lock()
+_settings_snapshot = None
+_settings_signature = None
+_settings_checked_at = 0.0
+
+def add_key_change_listener(callback):
+    """Register a callback invoked with the provider names whose API key changed"""
+    _key_change_listeners.append(callback)
 
 def _encode_api_key(key):
     """Simple base64 encoding for API keys (not encryption, just obfuscation)"""
@@ -39,6 +66,7 @@ def _decode_api_key(encoded_key):
         return ""
 
 def save_settings(settings):
+    previous_keys = get_api_keys()
     try:
         # Encode API keys before saving
         settings_to_save = settings.copy()
@@ -47,14 +75,35 @@ def save_settings(settings):
         if "groq_api_key" in settings_to_save:
             settings_to_save["groq_api_key"] = _encode_api_key(settings_to_save["groq_api_key"])
             
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings_to_save, f, indent=2)
-        return True
+        with _settings_lock:
+            with open(SETTINGS_FILE, 'w') as f:
+                json.dump(settings_to_save, f, indent=2)
+            saved = DEFAULT_SETTINGS.copy()
+            saved.update(settings)
+            _store_snapshot(saved, _file_signature())
     except Exception as e:
         print(f"Error saving settings: {e}")
         return False
 
-def load_settings():
+    changed = [provider for provider in ("openai", "groq")
+               if settings.get(f"{provider}_api_key", "") != previous_keys[provider]]
+    if changed:
+        for callback in _key_change_listeners:
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"Error notifying key change listener: {e}")
+    return True
+
+def _file_signature():
+    """Get (mtime, size) of the settings file, or None if it does not exist"""
+    try:
+        stat = os.stat(SETTINGS_FILE)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+def _read_settings_file():
     if os.path.exists(SETTINGS_FILE):
         try:
             with open(SETTINGS_FILE, 'r') as f:
@@ -76,20 +125,49 @@ def load_settings():
             return DEFAULT_SETTINGS.copy()
     return DEFAULT_SETTINGS.copy()
 
+def _store_snapshot(settings, signature):
+    global _settings_snapshot, _settings_signature, _settings_checked_at
+    _settings_snapshot = MappingProxyType(dict(settings))
+    _settings_signature = signature
+    _settings_checked_at = time.monotonic()
+    return _settings_snapshot
+
+def get_settings():
+    """Get a read-only snapshot of the settings, re-parsing the file only when it changed"""
+    global _settings_checked_at
+    with _settings_lock:
+        now = time.monotonic()
+        if _settings_snapshot is not None and now - _settings_checked_at < SETTINGS_CHECK_INTERVAL:
+            return _settings_snapshot
+
+        signature = _file_signature()
+        if _settings_snapshot is not None and signature == _settings_signature:
+            _settings_checked_at = now
+            return _settings_snapshot
+
+        return _store_snapshot(_read_settings_file(), signature)
+
+def load_settings():
+    """Get a mutable copy of the settings, e.g. for editing in the settings window"""
+    return dict(get_settings())
+
 def get_api_keys():
     """Get API keys from settings"""
-    settings = load_settings()
+    settings = get_settings()
     return {
         "openai": settings.get("openai_api_key", ""),
         "groq": settings.get("groq_api_key", "")
     }
 
 def show_settings_window(parent=None, on_settings_changed=None):
+    # Imported here so reading settings at startup doesn't load Tk
+    import tkinter as tk
+    from tkinter import ttk, messagebox
     settings = load_settings()
     
     settings_window = tk.Toplevel(parent) if parent else tk.Tk()
     settings_window.title("Lexia Settings")
-    settings_window.geometry("500x450")
+    settings_window.geometry("500x600")
     settings_window.resizable(False, False)
     
     # Create notebook for tabs
@@ -137,6 +215,31 @@ def show_settings_window(parent=None, on_settings_changed=None):
     alt_spinbox = tk.Spinbox(alt_frame, from_=1, to=5, textvariable=alt_var, width=10)
     alt_spinbox.pack(side=tk.LEFT, padx=5)
     
+    # Generation mode
+    parallel_var = tk.BooleanVar(value=settings.get("generation_mode") == "parallel")
+    tk.Checkbutton(general_frame, text="Generate alternatives in parallel (faster, uses more requests)",
+                   variable=parallel_var).pack(pady=5)
+    
+    # Speculative prefetch
+    prefetch_var = tk.BooleanVar(value=settings.get("prefetch_enabled", False))
+    tk.Checkbutton(general_frame, text="Prefetch likely next styles in the background (uses more requests)",
+                   variable=prefetch_var).pack(pady=5)
+    
+    # Similar earlier rewrites
+    similar_var = tk.BooleanVar(value=settings.get("similar_reuse_enabled", True))
+    tk.Checkbutton(general_frame, text="Offer earlier rewrites of nearly identical text while a new one runs",
+                   variable=similar_var).pack(pady=5)
+    
+    # Hedged requests
+    hedge_var = tk.BooleanVar(value=settings.get("hedge_requests", False))
+    tk.Checkbutton(general_frame, text="Race the other provider when a response is slow (needs both keys)",
+                   variable=hedge_var).pack(pady=5)
+    
+    # Latency tracing
+    tracing_var = tk.BooleanVar(value=settings.get("tracing_enabled", False))
+    tk.Checkbutton(general_frame, text="Record latency traces for troubleshooting (see tray → Latency Stats)",
+                   variable=tracing_var).pack(pady=5)
+    
     # Info Label
     info_label = tk.Label(general_frame, text="Note: Restart the application for hotkey changes to take effect", 
                          font=('Arial', 9, 'italic'), fg="gray")
@@ -242,14 +345,21 @@ def show_settings_window(parent=None, on_settings_changed=None):
                                  "• Groq: https://console.groq.com/keys")
             return
         
-        new_settings = {
+        # Start from the loaded settings so options without a widget here are kept
+        new_settings = settings.copy()
+        new_settings.update({
             "hotkey": hotkey_var.get(),
             "model": settings["model"],  # Keep existing model
             "temperature": temp_var.get(),
             "num_alternatives": alt_var.get(),
+            "generation_mode": "parallel" if parallel_var.get() else "combined",
+            "prefetch_enabled": prefetch_var.get(),
+            "similar_reuse_enabled": similar_var.get(),
+            "hedge_requests": hedge_var.get(),
+            "tracing_enabled": tracing_var.get(),
             "openai_api_key": openai_key,
             "groq_api_key": groq_key
-        }
+        })
         
         if save_settings(new_settings):
             messagebox.showinfo("Success", "Settings saved successfully!\n\nAPI keys are stored securely on your computer.")
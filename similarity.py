@@ -0,0 +1,157 @@
+"""
+Near-duplicate detection for Lexia's popup
+
+Users often rewrite text only trivially different from something they
+rewrote minutes ago (a fixed typo, a changed name), which the exact-match
+rewrite cache misses. This keeps a small in-memory index of recent rewrite
+inputs so the popup can offer the earlier alternatives while the fresh
+request runs.
+
+Each input is reduced to its word shingles (single words and word pairs,
+lowercased) and a MinHash signature of NUM_PERMUTATIONS 61-bit values; the
+share of equal positions in two signatures estimates the Jaccard similarity
+of their shingle sets. Signatures are split into LSH bands, and only entries
+sharing a band (and the same tone and model) are compared, so a lookup
+doesn't scan the whole index. Only the newest MAX_ENTRIES inputs are kept.
+
+Signatures are computed on a worker thread (submit_find / submit_add), never
+on the Tk thread.
+"""
+
+import array
+import concurrent.futures
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERMUTATIONS // BANDS
+MAX_ENTRIES = 200
+# Longer selections aren't indexed (they are chunked, and hashing them would hold up the worker)
+MAX_TEXT_CHARS = 50000
+DEFAULT_THRESHOLD = 0.6
+
+_WORD_RE = re.compile(r'\w+')
+_PRIME = (1 << 61) - 1
+_random = random.Random(0x1E71A)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+def shingles(text):
+    """The word shingles of text: every word and every pair of adjacent words"""
+    words = _WORD_RE.findall(text.lower())
+    return set(words) | {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+def signature(shingle_set):
+    """MinHash signature of a non-empty shingle set"""
+    # hash() is per-process, which is fine for an index that is never saved
+    hashes = [hash(shingle) & _PRIME for shingle in shingle_set]
+    return array.array("Q", [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS])
+
+def _text_key(text):
+    # Entries keep a digest rather than the (possibly long) text itself
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def estimate_similarity(first, second):
+    """Estimated Jaccard similarity of the inputs behind two signatures"""
+    return sum(x == y for x, y in zip(first, second)) / NUM_PERMUTATIONS
+
+class SimilarMatch:
+    """An earlier rewrite found for a new input"""
+
+    def __init__(self, similarity, alternatives, added):
+        self.similarity = similarity
+        self.alternatives = alternatives
+        self.added = added
+
+class SimilarityIndex:
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        # (text digest, tone, model) -> (signature, alternatives, added), oldest first
+        self._entries = OrderedDict()
+        # (tone, model, band, band values) -> keys of the entries in that bucket
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, sig, tone, model):
+        return [(tone, model, band, sig[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].tobytes())
+                for band in range(BANDS)]
+
+    def add(self, text, tone, model, alternatives):
+        """Remember the alternatives a rewrite of text produced"""
+        shingle_set = shingles(text)
+        if not shingle_set or len(text) > MAX_TEXT_CHARS:
+            return
+        sig = signature(shingle_set)
+        key = (_text_key(text), tone, model)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (sig, tuple(alternatives), time.time())
+            for band_key in self._band_keys(sig, tone, model):
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        sig = self._entries.pop(key)[0]
+        for band_key in self._band_keys(sig, key[1], key[2]):
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def find(self, text, tone, model, threshold=DEFAULT_THRESHOLD):
+        """Get the most similar earlier rewrite of a different text with the same tone and model, or None"""
+        shingle_set = shingles(text)
+        if not shingle_set or len(text) > MAX_TEXT_CHARS:
+            return None
+        sig = signature(shingle_set)
+        digest = _text_key(text)
+        with self._lock:
+            candidates = set()
+            for band_key in self._band_keys(sig, tone, model):
+                candidates |= self._buckets.get(band_key, set())
+            best = None
+            for key in candidates:
+                if key[0] == digest:
+                    # Same text: the rewrite cache answers that exactly
+                    continue
+                other, alternatives, added = self._entries[key]
+                similarity = estimate_similarity(sig, other)
+                if similarity >= threshold and (best is None or similarity > best.similarity):
+                    best = SimilarMatch(similarity, alternatives, added)
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+_index = None
+_index_lock = threading.Lock()
+_executor = None
+
+def get_similarity_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+        return _index
+
+def _get_executor():
+    global _executor
+    with _index_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexia-similar")
+        return _executor
+
+def submit_find(text, tone, model, threshold=DEFAULT_THRESHOLD):
+    """Look up a similar earlier rewrite on the worker thread; returns a Future of a SimilarMatch or None"""
+    return _get_executor().submit(get_similarity_index().find, text, tone, model, threshold)
+
+def submit_add(text, tone, model, alternatives):
+    """Index a finished rewrite on the worker thread"""
+    return _get_executor().submit(get_similarity_index().add, text, tone, model, alternatives)
@@ -0,0 +1,132 @@
+"""
+Large-text rendering for Lexia's popup
+
+Inserting a 100 KB selection into a Tk Text widget in one call stalls the
+window while Tk lays it out, and redoing that on every alternative switch
+makes the popup freeze. Texts over LARGE_TEXT_CHARS are therefore inserted a
+chunk per after() tick, and each alternative gets its own prebuilt widget,
+stacked in one grid cell, that is rendered once and then only raised, so
+switching alternatives costs the same whatever the text size.
+
+Must be used from the Tk thread.
+"""
+
+import tkinter as tk
+
+# Texts longer than this are inserted over several after() ticks instead of at once
+LARGE_TEXT_CHARS = 20000
+INSERT_CHUNK_CHARS = 8000
+
+def chunk_segments(segments, chunk_chars):
+    """Split (text, tags) segments into Text.insert argument lists of about chunk_chars characters each"""
+    batches = []
+    batch = []
+    size = 0
+    for text, tags in segments:
+        start = 0
+        while start < len(text):
+            piece = text[start:start + chunk_chars - size]
+            batch += [piece, tags]
+            size += len(piece)
+            start += len(piece)
+            if size >= chunk_chars:
+                batches.append(batch)
+                batch = []
+                size = 0
+    if batch:
+        batches.append(batch)
+    return batches
+
+class IncrementalInsert:
+    """Append segments to a Text widget: at once when small, otherwise a chunk per after() tick"""
+
+    def __init__(self, widget, segments, on_done=None):
+        self.widget = widget
+        self.on_done = on_done
+        self.done = False
+        self._after_id = None
+        total = sum(len(text) for text, _ in segments)
+        chunk_chars = INSERT_CHUNK_CHARS if total > LARGE_TEXT_CHARS else max(1, total)
+        self._batches = chunk_segments(segments, chunk_chars)
+        self._next = 0
+        # The first chunk goes in right away so the box is never blank for a tick
+        self._step()
+
+    def _step(self):
+        self._after_id = None
+        if self._next < len(self._batches):
+            self.widget.insert(tk.END, *self._batches[self._next])
+            self._next += 1
+        if self._next < len(self._batches):
+            self._after_id = self.widget.after(1, self._step)
+            return
+        self.done = True
+        if self.on_done:
+            self.on_done()
+
+    def cancel(self):
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+
+class AlternativeViews:
+    """Text widgets stacked in one grid cell, one per key (an alternative index, or "stream").
+
+    render() fills a key's widget only when what it should show has changed;
+    show() raises it. make_box(parent) creates and configures a new widget.
+    """
+
+    def __init__(self, parent, make_box):
+        self.parent = parent
+        self.make_box = make_box
+        self.current = None
+        self._views = {}
+        parent.grid_rowconfigure(0, weight=1)
+        parent.grid_columnconfigure(0, weight=1)
+
+    def _view(self, key):
+        view = self._views.get(key)
+        if view is None:
+            box = self.make_box(self.parent)
+            box.grid(row=0, column=0, sticky="nsew")
+            view = self._views[key] = {"box": box, "rendered": None, "insert": None}
+        return view
+
+    def box(self, key):
+        return self._view(key)["box"]
+
+    def render(self, key, segments, rendered_as):
+        """Show segments in key's widget unless it already holds rendered_as (compared with ==)"""
+        view = self._view(key)
+        if view["rendered"] is not None and view["rendered"] == rendered_as:
+            return
+        box = view["box"]
+        if view["insert"] is not None:
+            view["insert"].cancel()
+        box.delete("1.0", tk.END)
+        view["rendered"] = rendered_as
+        # The modified flag then only reflects edits by the user
+        view["insert"] = IncrementalInsert(box, segments, on_done=lambda: box.edit_modified(False))
+
+    def is_edited(self, key):
+        """Whether the user has typed in key's widget since it was rendered"""
+        view = self._views.get(key)
+        return bool(view and view["insert"] is not None and view["insert"].done and view["box"].edit_modified())
+
+    def show(self, key):
+        box = self._view(key)["box"]
+        # A ScrolledText sits in its own frame; that frame is what shares the grid cell
+        getattr(box, "frame", box).tkraise()
+        self.current = key
+
+    def current_box(self):
+        return self.box(self.current if self.current is not None else "stream")
+
+    def clear(self):
+        """Empty every widget, e.g. for a new request"""
+        for view in self._views.values():
+            if view["insert"] is not None:
+                view["insert"].cancel()
+                view["insert"] = None
+            view["box"].delete("1.0", tk.END)
+            view["rendered"] = None
@@ -0,0 +1,93 @@
+"""
+Token accounting for Lexia
+
+Counts prompt tokens locally so requests can be sized before they are sent:
+max_tokens is derived from the input length, the number of alternatives and
+how much the tone tends to grow or shrink text, and inputs that can't fit the
+model's context window are caught up front.
+
+tiktoken is used when it is installed (its encoding is loaded once, in the
+background, since the first load may download it); until then, or without
+it, counts fall back to a characters-per-token estimate.
+"""
+
+import math
+import threading
+
+# Context window per model, in tokens
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4": 8192,
+    "llama-4-scout": 131072
+}
+
+# Expected output length relative to the input, per alternative
+TONE_OUTPUT_FACTORS = {
+    "Neutral": 1.3,
+    "Formal": 1.5,
+    "Friendly": 1.5,
+    "Professional": 1.5,
+    "Concise": 0.9,
+    "Creative": 1.8
+}
+# Custom instructions may ask for anything ("expand this", "as bullet points")
+CUSTOM_TONE_OUTPUT_FACTOR = 2.5
+
+# Room per alternative for separators/headers, and a per-alternative floor for very short inputs
+ALTERNATIVE_OVERHEAD_TOKENS = 24
+MIN_OUTPUT_TOKENS = 128
+
+# Chat formatting cost per message and per reply (OpenAI's published accounting)
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+
+TIKTOKEN_ENCODING = "cl100k_base"
+
+_encoding = None
+_encoding_requested = False
+_encoding_lock = threading.Lock()
+
+def load_tokenizer():
+    """Load the tiktoken encoding if tiktoken is installed; blocks, so call it off the UI and engine threads"""
+    global _encoding
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    except ImportError:
+        return False
+    except Exception as e:
+        print(f"Error loading tokenizer: {e}")
+        return False
+    _encoding = encoding
+    return True
+
+def _request_tokenizer():
+    global _encoding_requested
+    with _encoding_lock:
+        if _encoding_requested:
+            return
+        _encoding_requested = True
+    threading.Thread(target=load_tokenizer, name="lexia-tokenizer", daemon=True).start()
+
+def count_tokens(text):
+    """Count the tokens in text, estimating until the tokenizer is available"""
+    encoding = _encoding
+    if encoding is None:
+        _request_tokenizer()
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages):
+    """Count the prompt tokens of a chat request"""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages) + REPLY_PRIMING_TOKENS
+
+def output_factor(tone):
+    return TONE_OUTPUT_FACTORS.get(tone, CUSTOM_TONE_OUTPUT_FACTOR)
+
+def max_output_tokens(input_tokens, num_alternatives, tone):
+    """Output budget for num_alternatives rewrites of a text of input_tokens in the given tone"""
+    per_alternative = input_tokens * output_factor(tone) + ALTERNATIVE_OVERHEAD_TOKENS
+    # The floor is per alternative: short inputs with a generous tone still need room for every one
+    return math.ceil(max(MIN_OUTPUT_TOKENS, per_alternative) * num_alternatives)
+
+def context_window(model):
+    return MODEL_CONTEXT_WINDOWS.get(model)
@@ -0,0 +1,176 @@
+"""
+Latency tracing for Lexia
+
+A hotkey session gets a Trace; each stage it goes through (capturing the
+selection, building the popup, creating the API client, time-to-first-token,
+the full request, parsing and rendering) is recorded as a span and appended to
+a rotating JSONL file. Rolling p50/p95 per stage and model are available from
+get_stage_stats() for the tray's latency window.
+
+Tracing is off unless "tracing_enabled" is set; start_trace() then returns a
+shared no-op trace, so instrumented code costs a method call per span.
+Entries are written (and the file rotated) on a worker thread, never on the
+thread that recorded them, which is often the Tk thread.
+"""
+
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from settings import get_settings
+
+TRACE_FILE = "lexia_trace.jsonl"
+TRACE_MAX_BYTES = 1_000_000
+TRACE_BACKUP_COUNT = 2
+STATS_WINDOW = 200
+
+# Display order for the stats table; anything else sorts after these
+STAGES = ["hotkey", "capture", "window", "client", "ttfb", "request", "parse", "render"]
+
+_write_lock = threading.Lock()
+_samples = {}
+_samples_loaded = False
+_executor = None
+_executor_lock = threading.Lock()
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _NullTrace:
+    """Stand-in used while tracing is disabled"""
+    enabled = False
+
+    def span(self, stage, model=None, **fields):
+        return _NULL_SPAN
+
+    def record(self, stage, seconds, model=None, **fields):
+        pass
+
+    def mark(self, stage, model=None, **fields):
+        pass
+
+NULL_TRACE = _NullTrace()
+
+class _Span:
+    def __init__(self, trace, stage, model, fields):
+        self.trace = trace
+        self.stage = stage
+        self.model = model
+        self.fields = fields
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.trace.record(self.stage, time.perf_counter() - self.started, self.model,
+                          error=exc_type is not None, **self.fields)
+        return False
+
+class Trace:
+    """Spans recorded during one hotkey session"""
+    enabled = True
+
+    def __init__(self):
+        self.session = uuid.uuid4().hex[:12]
+        # When the hotkey fired; "hotkey" spans are measured from here
+        self.started = time.perf_counter()
+
+    def span(self, stage, model=None, **fields):
+        """Context manager recording how long its body took"""
+        return _Span(self, stage, model, fields)
+
+    def record(self, stage, seconds, model=None, **fields):
+        """Record a stage whose duration was measured elsewhere"""
+        entry = {"ts": round(time.time(), 3), "session": self.session, "stage": stage,
+                 "model": model, "ms": round(seconds * 1000, 3)}
+        entry.update(fields)
+        _submit_entry(entry)
+
+    def mark(self, stage, model=None, **fields):
+        """Record the time from the hotkey press until now"""
+        self.record(stage, time.perf_counter() - self.started, model, **fields)
+
+def start_trace():
+    """Start tracing a hotkey session, or get the no-op trace if tracing is disabled"""
+    if get_settings().get("tracing_enabled", False):
+        return Trace()
+    return NULL_TRACE
+
+def _rotate():
+    for index in range(TRACE_BACKUP_COUNT, 0, -1):
+        source = TRACE_FILE if index == 1 else f"{TRACE_FILE}.{index - 1}"
+        if os.path.exists(source):
+            os.replace(source, f"{TRACE_FILE}.{index}")
+
+def _remember(entry):
+    key = (entry.get("stage"), entry.get("model"))
+    samples = _samples.get(key)
+    if samples is None:
+        samples = _samples[key] = deque(maxlen=STATS_WINDOW)
+    samples.append(entry.get("ms", 0.0))
+
+def _write_entry(entry):
+    with _write_lock:
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) >= TRACE_MAX_BYTES:
+                _rotate()
+            with open(TRACE_FILE, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing trace: {e}")
+        # Until the stats are first asked for, the file is the only copy
+        if _samples_loaded and not entry.get("error"):
+            _remember(entry)
+
+def _submit_entry(entry):
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # One worker, so entries reach the file in the order they were recorded
+            _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexia-trace")
+    _executor.submit(_write_entry, entry)
+
+def _load_samples():
+    global _samples_loaded
+    _samples.clear()
+    try:
+        with open(TRACE_FILE, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if not entry.get("error"):
+                    _remember(entry)
+    except OSError:
+        pass
+    _samples_loaded = True
+
+def _percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def get_stage_stats():
+    """Get rolling count/p50/p95 (milliseconds) keyed by (stage, model)"""
+    with _write_lock:
+        if not _samples_loaded:
+            _load_samples()
+        snapshot = {key: list(samples) for key, samples in _samples.items()}
+
+    def order(key):
+        stage, model = key
+        return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage or "", model or "")
+
+    return {key: {"count": len(samples), "p50": _percentile(samples, 0.5), "p95": _percentile(samples, 0.95)}
+            for key, samples in sorted(snapshot.items(), key=lambda item: order(item[0])) if samples}
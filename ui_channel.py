@@ -0,0 +1,92 @@
+"""
+UI update channel for Lexia
+
+Tk may only be touched from the thread running its mainloop, but rewrite
+results arrive on the engine thread and update checks on worker threads.
+Those threads post callbacks here instead; the Tk thread drains the queue on
+an after() tick, once per frame.
+
+Updates that only matter in their latest form (streamed partial text) are
+posted with post_latest() under a key, and only the last one per key in a
+frame is run, so a fast token stream costs one redraw per frame rather than
+one per token.
+"""
+
+import queue
+import threading
+import tkinter as tk
+
+# One drain per frame at ~60 fps
+FRAME_INTERVAL_MS = 16
+
+class UIChannel:
+    def __init__(self, interval_ms=FRAME_INTERVAL_MS):
+        self.interval_ms = interval_ms
+        self._queue = queue.SimpleQueue()
+        self._root = None
+        self._thread = None
+
+    def attach(self, root):
+        """Start draining on root's after() tick; call from the thread running root's mainloop"""
+        self._root = root
+        self._thread = threading.current_thread()
+        root.after(self.interval_ms, self._tick)
+
+    def in_ui_thread(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the Tk thread, in order with other posts"""
+        self._queue.put((None, callback, args))
+
+    def post_latest(self, key, callback, *args):
+        """Like post(), but superseded by a later post_latest() with the same key in the same frame"""
+        self._queue.put((key, callback, args))
+
+    def wrap(self, callback):
+        """Get a thread-safe version of callback that posts each call"""
+        return lambda *args: self.post(callback, *args)
+
+    def drain(self):
+        """Run everything posted so far; returns how many callbacks ran"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+
+        last_for_key = {}
+        for position, (key, _, _) in enumerate(batch):
+            if key is not None:
+                last_for_key[key] = position
+
+        ran = 0
+        for position, (key, callback, args) in enumerate(batch):
+            if key is not None and last_for_key[key] != position:
+                continue
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in UI callback: {e}")
+            ran += 1
+        return ran
+
+    def _tick(self):
+        self.drain()
+        try:
+            self._root.after(self.interval_ms, self._tick)
+        except tk.TclError:
+            # The root was destroyed
+            pass
+
+_channel = None
+_channel_lock = threading.Lock()
+
+def get_ui_channel():
+    """Get the process-wide UI channel"""
+    global _channel
+    with _channel_lock:
+        if _channel is None:
+            _channel = UIChannel()
+        return _channel
@@ -5,15 +5,22 @@ import threading
 import webbrowser
 import json
 import urllib.request
-from rewriter import rewrite_text_with_gpt
-from settings import show_settings_window, load_settings
+import time
+from rewriter import submit_rewrite, get_connection_stats, get_prompt_cache_stats
+from rewrite_jobs import RewriteJobSlot
+from settings import show_settings_window, get_settings
+from prefetch import Prefetcher, submit_tone_switch
+from ui_channel import get_ui_channel
+from tracing import NULL_TRACE, STAGES, TRACE_FILE, get_stage_stats
+from word_diff import submit_diff, INSERT, DELETE, REPLACE
+from similarity import submit_find, submit_add, DEFAULT_THRESHOLD
+from text_views import AlternativeViews, IncrementalInsert
 from version import VERSION_INFO, get_version_string
 
 selected_tone = "Neutral"
 selected_alternative = 0
 alternatives = []
 selected_model = None
-is_rewriting = False
 
 # Application metadata
 APP_VERSION = VERSION_INFO["version"]
@@ -21,6 +28,8 @@ APP_NAME = VERSION_INFO["name"]
 AUTHOR = VERSION_INFO["author"]
 GITHUB_URL = "https://github.com/stardust-96/lexia"
 RELEASE_API_URL = "https://api.github.com/repos/stardust-96/lexia/releases/latest"
+# Longer error messages are cut short in the popup's status line (the full text is in the view)
+MAX_STATUS_ERROR_CHARS = 120
 
 def show_about_dialog(parent):
     """Show the About dialog with application information."""
@@ -78,39 +87,45 @@ def show_about_dialog(parent):
     def check_updates():
         update_btn.config(text="Checking...", state="disabled")
         
+        def report(latest_version, error):
+            # Runs on the UI thread
+            if not about_window.winfo_exists():
+                return
+            update_btn.config(text="Check for Updates", state="normal")
+            if error is not None:
+                messagebox.showerror(
+                    "Update Check Failed",
+                    f"Could not check for updates:\n{str(error)}",
+                    parent=about_window
+                )
+            elif latest_version and latest_version != APP_VERSION:
+                result = messagebox.askyesno(
+                    "Update Available",
+                    f"A new version ({latest_version}) is available!\n\n"
+                    f"Current version: {APP_VERSION}\n\n"
+                    "Would you like to visit the download page?",
+                    parent=about_window
+                )
+                if result:
+                    webbrowser.open(GITHUB_URL + "/releases/latest")
+            else:
+                messagebox.showinfo(
+                    "No Updates",
+                    f"{APP_NAME} is up to date!",
+                    parent=about_window
+                )
+        
         def check():
             try:
                 # Simple version check against GitHub releases
                 with urllib.request.urlopen(RELEASE_API_URL, timeout=5) as response:
                     data = json.loads(response.read())
                     latest_version = data.get("tag_name", "").lstrip("v")
-                    
-                    if latest_version and latest_version != APP_VERSION:
-                        result = messagebox.askyesno(
-                            "Update Available",
-                            f"A new version ({latest_version}) is available!\n\n"
-                            f"Current version: {APP_VERSION}\n\n"
-                            "Would you like to visit the download page?",
-                            parent=about_window
-                        )
-                        if result:
-                            webbrowser.open(GITHUB_URL + "/releases/latest")
-                    else:
-                        messagebox.showinfo(
-                            "No Updates",
-                            f"{APP_NAME} is up to date!",
-                            parent=about_window
-                        )
+                get_ui_channel().post(report, latest_version, None)
             except Exception as e:
-                messagebox.showerror(
-                    "Update Check Failed",
-                    f"Could not check for updates:\n{str(e)}",
-                    parent=about_window
-                )
-            finally:
-                update_btn.config(text="Check for Updates", state="normal")
+                get_ui_channel().post(report, None, e)
         
-        # Run in thread to avoid blocking UI
+        # Run in thread to avoid blocking UI; the result is shown back on the UI thread
         threading.Thread(target=check, daemon=True).start()
     
     update_btn = tk.Button(button_frame, text="Check for Updates", 
@@ -131,90 +146,331 @@ def show_about_dialog(parent):
              bg="#95a5a6", fg="white", font=("Arial", 10), 
              padx=35, pady=8, relief=tk.RAISED, bd=2).pack(pady=5)
 
-def show_popup(original: str):
-    def start_rewrite():
-        global is_rewriting
-        if is_rewriting:
-            return  # Prevent multiple simultaneous rewrites
-        
-        is_rewriting = True
+def show_latency_dialog(parent):
+    """Show rolling per-stage latency percentiles from the trace log."""
+    latency_window = tk.Toplevel(parent)
+    latency_window.title(f"{APP_NAME} Latency")
+    latency_window.geometry("560x420")
+    
+    stats = get_stage_stats()
+    text_box = scrolledtext.ScrolledText(latency_window, font=("Courier New", 10), wrap=tk.NONE,
+                                         bg="white", relief="solid", bd=1)
+    text_box.pack(fill=tk.BOTH, expand=True, padx=10, pady=(10, 5))
+    if stats:
+        lines = [f"{'Stage':<10}{'Model':<16}{'n':>6}{'p50 ms':>12}{'p95 ms':>12}"]
+        for (stage, model), row in stats.items():
+            lines.append(f"{stage:<10}{model or '-':<16}{row['count']:>6}{row['p50']:>12.1f}{row['p95']:>12.1f}")
+        lines.append("")
+        lines.append("Stages: " + ", ".join(STAGES))
+    else:
+        lines = ["No traces recorded yet.",
+                 "",
+                 "Turn on \"Record latency traces\" in Settings, use Lexia for a while,",
+                 "then open this window again."]
+    lines.append(f"Trace file: {TRACE_FILE}")
+    lines.append("")
+    lines.append("Prompt cache since startup (share of prompt tokens the provider had cached):")
+    for provider, counts in get_prompt_cache_stats().items():
+        ratio = f"{counts['ratio']:.0%}" if counts["ratio"] is not None else "-"
+        lines.append(f"  {provider:<8}{ratio:>6} of {counts['prompt_tokens']} tokens in {counts['responses']} responses")
+    connections = get_connection_stats()
+    lines.append(f"Connections since startup: {connections['opened']} opened, {connections['reused']} reused")
+    text_box.insert(tk.END, "\n".join(lines))
+    text_box.config(state='disabled')
+    
+    tk.Button(latency_window, text="Close", command=latency_window.destroy,
+              bg="#95a5a6", fg="white", font=("Arial", 10), padx=35, pady=5).pack(pady=(0, 10))
+    return latency_window
+
+# Text tags for the change highlighting in the rewritten text boxes
+DIFF_TAGS = {INSERT: "diff_insert", REPLACE: "diff_replace", DELETE: "diff_delete"}
+
+def _tagged_segments(segments):
+    """Turn word_diff segments into (text, tags) segments for AlternativeViews"""
+    return [(text, (DIFF_TAGS[tag],) if tag else ()) for text, tag in segments]
+
+def _format_age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{seconds // 60:.0f} min ago"
+    return f"{seconds // 3600:.0f} h ago"
+
+def build_popup(root):
+    """Build the rewrite popup once, hidden, and return a function that shows it for new text.
+
+    show(original, trace, on_close) resets the prebuilt widgets for the new
+    text and deiconifies the window; closing only withdraws it again. Must be
+    called on the thread that owns root.
+    """
+    channel = get_ui_channel()
+
+    # Everything that belongs to one hotkey session
+    session = {"original": "", "trace": NULL_TRACE, "on_close": None, "last_tone": None,
+               "prefetcher": None, "jobs": RewriteJobSlot(), "diffs": {}, "original_insert": None,
+               "on_screen": None}
+
+    def start_rewrite(force_fresh=False):
+        # A new request supersedes (and cancels) whatever is still running
+        original = session["original"]
+        trace = session["trace"]
+        prefetcher = session["prefetcher"]
+        jobs = session["jobs"]
         effective_tone = get_effective_tone()
+        model = model_var.get()
         loading_label.config(text=f"⏳ Rewriting in {effective_tone} tone...")
-        submit_button.config(state='disabled')
         for widget in alternative_frame.winfo_children():
             widget.destroy()
+        for widget in similar_frame.winfo_children():
+            widget.destroy()
 
-        def process():
+        def submit(job):
             global alternatives, selected_alternative
             
             # Show loading animation
-            loading_label.config(text="⏳ Rewriting with " + model_var.get() + "...", fg="#0066cc")
-            popup.update()
-            
-            # Override model for this rewrite
-            import json
-            temp_settings = load_settings()
-            temp_settings['model'] = model_var.get()
+            loading_label.config(text="⏳ Rewriting with " + model + "...", fg="#0066cc")
             
-            # Load current settings to get num_alternatives
-            current_settings = load_settings()
-            num_alts = current_settings.get('num_alternatives', 3)
-            alternatives = rewrite_text_with_gpt(original, effective_tone, num_alternatives=num_alts, model_override=model_var.get())
+            num_alts = get_settings().get('num_alternatives', 3)
+            alternatives = []
             selected_alternative = 0
-            
-            print(f"Generated {len(alternatives)} alternatives")  # Debug
-            
-            for widget in alternative_frame.winfo_children():
-                widget.destroy()
-            
             radio_var.set(0)
-            for i, alt in enumerate(alternatives):
+            stream_state = {"follow": True, "displayed": ""}
+            request_stats = {}
+            request_started = time.perf_counter()
+
+            def add_radio(i):
                 radio = tk.Radiobutton(alternative_frame, text=f"v{i+1}", 
                                      variable=radio_var, value=i, 
-                                     command=lambda idx=i: update_alternative(idx),
+                                     command=lambda idx=i: select_alternative(idx, stream_state),
                                      bg="white", font=("Arial", 10, "bold"), relief="raised", bd=2,
                                      padx=8, pady=4, selectcolor="#3498db")
                 radio.pack(side=tk.LEFT, padx=3)
+
+            def show_partial(index, text):
+                # Follow the alternative being streamed until the user picks a finished one
+                if not stream_state["follow"] or not jobs.is_current(job):
+                    return
+                displayed = stream_state["displayed"]
+                if text.startswith(displayed):
+                    rewritten_box.insert(tk.END, text[len(displayed):])
+                else:
+                    rewritten_box.delete("1.0", tk.END)
+                    rewritten_box.insert(tk.END, text)
+                rewritten_box.see(tk.END)
+                stream_state["displayed"] = text
+
+            def show_completed(index, text):
+                if not jobs.is_current(job):
+                    return
+                alternatives.append(text)
+                add_radio(index)
+                if stream_state["follow"]:
+                    stream_state["displayed"] = ""
+                    rewritten_box.delete("1.0", tk.END)
+                loading_label.config(text=f"⏳ Received {index + 1} of {num_alts} alternatives...", fg="#0066cc")
+
+            def show_progress(done, total):
+                if not jobs.is_current(job):
+                    return
+                loading_label.config(text=f"⏳ Long text: rewrote {done} of {total} parts...", fg="#0066cc")
+
+            def show_waiting(provider, seconds, reason, queued):
+                # Held in the provider's queue; only until the response starts streaming
+                if not jobs.is_current(job) or stream_state["displayed"] or alternatives:
+                    return
+                provider_name = {"openai": "OpenAI", "groq": "Groq"}.get(provider, provider)
+                waiting = f"waiting {seconds:.0f}s" if seconds >= 1 else "waiting"
+                queue_note = f", {queued} queued" if queued > 1 else ""
+                loading_label.config(text=f"⏳ {provider_name}: {reason}, {waiting}{queue_note}...", fg="#cc6600")
+
+            def show_final(future):
+                global alternatives
+                # A newer request took over while this one was finishing; never overwrite its results
+                if future.cancelled() or not jobs.is_current(job):
+                    return
+                if future.exception() is not None:
+                    # rewrite_async reports request failures as an "Error:" result; this is anything else
+                    alternatives = [f"Error: {future.exception()}"]
+                else:
+                    alternatives = future.result()
+                answered_by = request_stats.get("model", model)
+                failed = alternatives[0].startswith("Error:")
+                usage = request_stats.get("usage") or {}
+                trace.record("request", time.perf_counter() - request_started, answered_by,
+                             cached=request_stats.get("cached", False), error=failed,
+                             prompt_tokens_estimate=request_stats.get("prompt_tokens_estimate"),
+                             prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                             cached_tokens=usage.get("cached_tokens"), queue_wait=request_stats.get("queue_wait"),
+                             max_tokens=request_stats.get("max_tokens"), truncated=request_stats.get("truncated", False),
+                             hedged=request_stats.get("hedged", False), hedge_saved=request_stats.get("hedge_saved"))
+                for stage, key in (("client", "client_setup"), ("ttfb", "ttfb"), ("parse", "parse")):
+                    if request_stats.get(key) is not None:
+                        trace.record(stage, request_stats[key], answered_by)
             
-            update_alternative(0)
+                # The final list may differ from what was streamed (fallback parsing, padding)
+                for widget in alternative_frame.winfo_children():
+                    widget.destroy()
             
-            loading_label.config(text="✅ Rewriting complete. Select an alternative:", fg="#009900")
-            copy_button.config(state='normal')
-            submit_button.config(state='normal')
+                for i in range(len(alternatives)):
+                    add_radio(i)
+                if not failed:
+                    # Diff every alternative up front so switching between them is instant
+                    for alternative in alternatives:
+                        request_diff(alternative)
             
-            global is_rewriting
-            is_rewriting = False  # Reset the flag
+                with trace.span("render", answered_by):
+                    if isinstance(views.current, tuple):
+                        # The user is reading a similar earlier rewrite; the v buttons switch back
+                        pass
+                    elif stream_state["follow"]:
+                        radio_var.set(0)
+                        update_alternative(0)
+                    else:
+                        update_alternative(min(selected_alternative, len(alternatives) - 1))
+            
+                truncated = request_stats.get("truncated", False)
+                if failed:
+                    message = alternatives[0][len("Error:"):].strip()
+                    if len(message) > MAX_STATUS_ERROR_CHARS:
+                        message = message[:MAX_STATUS_ERROR_CHARS - 1] + "…"
+                    loading_label.config(text=f"❌ Rewrite failed: {message}", fg="#c0392b")
+                elif truncated:
+                    loading_label.config(text="⚠️ The response hit its length limit and was cut short; "
+                                              "some alternatives may be incomplete or repeated.", fg="#cc6600")
+                elif answered_by != model:
+                    answered_display = dict(model_options).get(answered_by, answered_by)
+                    loading_label.config(text=f"✅ Rewriting complete (answered faster by {answered_display}). Select an alternative:",
+                                         fg="#009900")
+                else:
+                    loading_label.config(text="✅ Rewriting complete. Select an alternative:", fg="#009900")
+                copy_button.config(state='normal')
+            
+                if not failed:
+                    if session["last_tone"] is not None:
+                        submit_tone_switch(session["last_tone"], effective_tone)
+                    session["last_tone"] = effective_tone
+                    prefetcher.start(original, effective_tone, model)
+                    if get_settings().get("similar_reuse_enabled", True) and not truncated:
+                        submit_add(original, effective_tone, model, alternatives)
+
+            # The engine calls back on its own thread; hop to the UI thread, keeping only
+            # the latest partial text per frame
+            def on_text(index, text):
+                channel.post_latest("stream", show_partial, index, text)
+
+            views.clear()
+            views.show("stream")
+            future = submit_rewrite(original, effective_tone, num_alternatives=num_alts, model_override=model,
+                                    on_text=on_text, on_alternative=channel.wrap(show_completed),
+                                    force_fresh=force_fresh, stats=request_stats,
+                                    on_progress=lambda done, total: channel.post_latest("progress", show_progress,
+                                                                                        done, total),
+                                    on_wait=lambda *wait: channel.post_latest("progress", show_waiting, *wait))
+            future.add_done_callback(channel.wrap(show_final))
 
-        threading.Thread(target=process).start()
+            def offer_similar(lookup):
+                if lookup.exception() is not None:
+                    print(f"Error looking up similar rewrites: {lookup.exception()}")
+                    return
+                # Only while the fresh request is still running, and only for this request
+                match = lookup.result()
+                if match is None or future.done() or not jobs.is_current(job):
+                    return
+                tk.Label(similar_frame, text=f"↺ {match.similarity:.0%} like a text rewritten "
+                                             f"{_format_age(time.time() - match.added)}:",
+                         font=("Arial", 9), fg="#8e44ad", bg="#f5f5f5").pack(side=tk.LEFT)
+                for i, text in enumerate(match.alternatives):
+                    tk.Button(similar_frame, text=f"p{i+1}",
+                              command=lambda key=("similar", i), text=text: show_similar(key, text),
+                              font=("Arial", 9), bg="#f4ecf7", relief="groove", padx=4).pack(side=tk.LEFT, padx=1)
+
+            settings = get_settings()
+            if settings.get("similar_reuse_enabled", True):
+                submit_find(original, effective_tone, model,
+                            settings.get("similar_reuse_threshold", DEFAULT_THRESHOLD)).add_done_callback(
+                    channel.wrap(offer_similar))
+            return future
+
+        jobs.start(submit)
+
+    def select_alternative(idx, stream_state):
+        # A manual pick stops the box from following the stream
+        stream_state["follow"] = False
+        update_alternative(idx)
+
+    def request_diff(text):
+        """Diff an alternative against the original off the UI thread, once per session"""
+        diffs = session["diffs"]
+        if text in diffs or text.startswith("Error:"):
+            return
+        diffs[text] = None
+        original = session["original"]
+
+        def show_diff(segments):
+            if session["diffs"] is not diffs:
+                # The popup has moved on to new text
+                return
+            diffs[text] = _tagged_segments(segments)
+            # Redraw only if this text is on screen and unedited
+            on_screen = session["on_screen"]
+            if (highlight_var.get() and on_screen and on_screen[1] == text and views.current == on_screen[0]
+                    and not views.is_edited(on_screen[0])):
+                render_view(*on_screen)
+
+        def diff_done(future):
+            if future.exception() is None:
+                channel.post(show_diff, future.result())
+            else:
+                print(f"Error computing diff: {future.exception()}")
+
+        submit_diff(original, text).add_done_callback(diff_done)
+
+    def render_view(key, content):
+        # Each text is rendered into its own box once; switching only raises it
+        segments = session["diffs"].get(content) if highlight_var.get() else None
+        if segments:
+            views.render(key, segments, (content, True))
+        else:
+            views.render(key, [(content, ())], (content, False))
+            if highlight_var.get():
+                request_diff(content)
+        views.show(key)
+        session["on_screen"] = (key, content)
 
     def update_alternative(idx):
         global selected_alternative
         selected_alternative = idx
-        rewritten_box.config(state='normal')
-        rewritten_box.delete("1.0", tk.END)
-        rewritten_box.insert(tk.END, alternatives[idx])
-        rewritten_box.config(state='normal')
-        
-        # Adjust height based on content - more aggressive sizing
-        content = alternatives[idx]
-        
-        # Simple but effective line calculation
-        char_count = len(content)
-        estimated_lines = max(4, char_count // 60)  # Roughly 60 chars per line
-        line_breaks = content.count('\n')
-        total_lines = estimated_lines + line_breaks
-        
-        # Set height with generous range for better visibility
-        new_height = max(12, min(25, total_lines + 3))  # Between 12-25 lines, +3 for padding
-        rewritten_box.config(height=new_height)
-        
-        # Force layout update
-        rewritten_box.update_idletasks()
+        render_view(idx, alternatives[idx])
+
+    def show_similar(key, text):
+        # Shows a similar earlier rewrite, highlighted against the current text; it can be copied as is
+        render_view(key, text)
+        copy_button.config(state='normal')
     
     def copy_to_clipboard():
-        text = rewritten_box.get("1.0", tk.END).strip()
+        # Struck-through deleted words are only shown, never copied
+        box = views.current_box()
+        pieces = []
+        start = "1.0"
+        deleted = box.tag_ranges(DIFF_TAGS[DELETE])
+        for deleted_start, deleted_end in zip(deleted[0::2], deleted[1::2]):
+            pieces.append(box.get(start, deleted_start))
+            start = deleted_end
+        pieces.append(box.get(start, tk.END))
+        text = "".join(pieces).strip()
         pyperclip.copy(text)
-        popup.destroy()
+        hide()
+
+    def hide():
+        # The window is kept for the next hotkey; only this session's work is dropped
+        popup.withdraw()
+        session["jobs"].cancel_all()
+        if session["prefetcher"] is not None:
+            session["prefetcher"].cancel()
+        on_close = session["on_close"]
+        session["on_close"] = None
+        if on_close:
+            on_close()
 
     def get_effective_tone():
         # Get custom tone, but ignore placeholder text
@@ -236,15 +492,17 @@ def show_popup(original: str):
         if selected_tone.strip():  # Only if there's actual content
             start_rewrite()
 
-    # Create enhanced styled window
-    popup = tk.Tk()
+    # Create enhanced styled window, hidden until the first hotkey
+    popup = tk.Toplevel(root)
+    popup.withdraw()
     popup.title("Lexia - Text Enhancement")
     popup.geometry("900x800")
     popup.resizable(False, False)
     popup.configure(bg="#f5f5f5")
+    popup.protocol("WM_DELETE_WINDOW", hide)
     
     # Custom style
-    style = ttk.Style()
+    style = ttk.Style(root)
     style.theme_use('clam')
     style.configure('Card.TLabelframe', background='#ffffff', relief='raised', borderwidth=2)
     style.configure('Card.TLabelframe.Label', background='#ffffff', font=('Arial', 10, 'bold'))
@@ -252,12 +510,6 @@ def show_popup(original: str):
     style.configure('Success.TButton', font=('Arial', 10, 'bold'))
     style.configure('Danger.TButton', font=('Arial', 10, 'bold'))
     
-    # Ensure window appears on top and not minimized
-    popup.lift()
-    popup.attributes('-topmost', True)
-    popup.after(100, lambda: popup.attributes('-topmost', False))
-    popup.focus_force()
-    
     # Add menu bar
     menubar = Menu(popup)
     popup.config(menu=menubar)
@@ -267,25 +519,22 @@ def show_popup(original: str):
     menubar.add_cascade(label="File", menu=file_menu)
     file_menu.add_command(label="Settings", command=lambda: show_settings_window(popup, update_model_settings))
     file_menu.add_separator()
-    file_menu.add_command(label="Exit", command=popup.destroy)
+    file_menu.add_command(label="Exit", command=hide)
     
     # Help menu
     help_menu = Menu(menubar, tearoff=0)
     menubar.add_cascade(label="Help", menu=help_menu)
     help_menu.add_command(label="About", command=lambda: show_about_dialog(popup))
-    
-    settings = load_settings()
-    model_display = "GPT-4 (OpenAI)" if settings['model'] == "gpt-4" else "Llama-4-Scout (Groq)"
-    help_menu.add_command(label=f"Model: {model_display}", state='disabled')
-    help_menu.add_command(label=f"Temperature: {settings['temperature']}", state='disabled')
-    help_menu.add_command(label=f"Alternatives: {settings['num_alternatives']}", state='disabled')
+    help_menu.add_command(label="Model", state='disabled')
+    help_menu.add_command(label="Temperature", state='disabled')
+    help_menu.add_command(label="Alternatives", state='disabled')
     
     def update_model_settings(new_settings):
         # Update help menu with new settings
         model_display = "GPT-4 (OpenAI)" if new_settings['model'] == "gpt-4" else "Llama-4-Scout (Groq)"
-        help_menu.entryconfig(0, label=f"Model: {model_display}")
-        help_menu.entryconfig(1, label=f"Temperature: {new_settings['temperature']}")
-        help_menu.entryconfig(2, label=f"Alternatives: {new_settings['num_alternatives']}")
+        help_menu.entryconfig(1, label=f"Model: {model_display}")
+        help_menu.entryconfig(2, label=f"Temperature: {new_settings['temperature']}")
+        help_menu.entryconfig(3, label=f"Alternatives: {new_settings['num_alternatives']}")
 
     # Header
     header_frame = tk.Frame(popup, bg="#2c3e50", height=60)
@@ -304,13 +553,11 @@ def show_popup(original: str):
     model_card = ttk.LabelFrame(selection_frame, text="🚀 Model Selection", style='Card.TLabelframe', padding=15)
     model_card.pack(side=tk.LEFT, padx=10, fill=tk.BOTH, expand=True)
     
-    model_var = tk.StringVar(value=settings.get('model', 'llama-4-scout'))
+    model_var = tk.StringVar(popup, value="llama-4-scout")
     model_options = [("gpt-4", "GPT-4 (OpenAI)"), ("llama-4-scout", "Llama-4-Scout (Groq)")]
     
     def on_model_change():
-        # Only trigger rewrite if not currently rewriting
-        if not is_rewriting:
-            start_rewrite()
+        start_rewrite()
     
     for value, display in model_options:
         rb = tk.Radiobutton(model_card, text=display, variable=model_var, 
@@ -323,7 +570,7 @@ def show_popup(original: str):
     tone_card.pack(side=tk.LEFT, padx=10, fill=tk.BOTH, expand=True)
     
     tk.Label(tone_card, text="Preset Styles:", font=("Arial", 9), bg="white").pack(anchor=tk.W, pady=(0, 2))
-    tone_var = tk.StringVar(value="Neutral")
+    tone_var = tk.StringVar(popup, value="Neutral")
     tone_options = ["Neutral", "Formal", "Friendly", "Professional", "Concise", "Creative", "Custom"]
     tone_dropdown = ttk.Combobox(tone_card, textvariable=tone_var, values=tone_options, 
                                 state='readonly', width=20, font=("Arial", 10))
@@ -333,7 +580,7 @@ def show_popup(original: str):
     
     # Custom instructions text box
     tk.Label(tone_card, text="Custom Instructions:", font=("Arial", 9), bg="white").pack(anchor=tk.W, pady=(10, 2))
-    custom_tone_var = tk.StringVar()
+    custom_tone_var = tk.StringVar(popup)
     custom_tone_entry = tk.Entry(tone_card, textvariable=custom_tone_var, font=("Arial", 10),
                                 relief="sunken", bd=2)
     custom_tone_entry.pack(fill=tk.X, pady=(0, 5))
@@ -352,9 +599,6 @@ def show_popup(original: str):
             custom_tone_entry.insert(0, placeholder_text)
             custom_tone_entry.config(fg='gray')
     
-    # Set initial placeholder
-    custom_tone_entry.insert(0, placeholder_text)
-    custom_tone_entry.config(fg='gray')
     custom_tone_entry.bind("<FocusIn>", on_focus_in)
     custom_tone_entry.bind("<FocusOut>", on_focus_out)
 
@@ -371,7 +615,8 @@ def show_popup(original: str):
     button_frame.pack()
 
     # Enhanced styled buttons
-    submit_button = tk.Button(button_frame, text="🔄 Rewrite", command=start_rewrite, 
+    # The Rewrite button always re-rolls; tone/model changes may be served from cache
+    submit_button = tk.Button(button_frame, text="🔄 Rewrite", command=lambda: start_rewrite(force_fresh=True), 
                              bg="#3498db", fg="white", font=("Arial", 11, "bold"),
                              relief="raised", bd=2, padx=20, pady=8)
     submit_button.pack(side=tk.LEFT, padx=5)
@@ -382,7 +627,7 @@ def show_popup(original: str):
     copy_button.pack(side=tk.LEFT, padx=5)
 
 
-    cancel_button = tk.Button(button_frame, text="❌ Cancel", command=popup.destroy, 
+    cancel_button = tk.Button(button_frame, text="❌ Cancel", command=hide, 
                              bg="#e74c3c", fg="white", font=("Arial", 11, "bold"),
                              relief="raised", bd=2, padx=20, pady=8)
     cancel_button.pack(side=tk.LEFT, padx=5)
@@ -396,14 +641,8 @@ def show_popup(original: str):
     orig_header.pack(fill=tk.X, pady=(0, 5))
     tk.Label(orig_header, text="📝 Original Text", font=('Arial', 10, 'bold'), bg="#f5f5f5").pack(side=tk.LEFT)
     
-    # Calculate height based on text length - keep original text compact
-    orig_lines = len(original.split('\n')) + (len(original) // 80)  # Estimate wrapped lines
-    orig_height = max(2, min(4, orig_lines))  # Between 2-4 lines
-    
-    original_box = scrolledtext.ScrolledText(content_frame, height=orig_height, font=("Arial", 10), 
+    original_box = scrolledtext.ScrolledText(content_frame, height=2, font=("Arial", 10), 
                                            wrap=tk.WORD, bg="white", relief="solid", bd=1)
-    original_box.insert(tk.END, original)
-    original_box.config(state='disabled')
     original_box.pack(fill=tk.X, pady=(0, 15))
 
     # Rewritten text section with inline buttons
@@ -412,15 +651,139 @@ def show_popup(original: str):
     
     tk.Label(rewrite_header, text="✨ Rewritten Text", font=('Arial', 10, 'bold'), bg="#f5f5f5").pack(side=tk.LEFT)
     
+    def on_highlight_toggle():
+        on_screen = session["on_screen"]
+        if on_screen and views.current == on_screen[0]:
+            render_view(*on_screen)
+    
+    highlight_var = tk.BooleanVar(popup, value=True)
+    tk.Checkbutton(rewrite_header, text="Highlight changes", variable=highlight_var, command=on_highlight_toggle,
+                   font=("Arial", 9), bg="#f5f5f5").pack(side=tk.LEFT, padx=10)
+    
+    # Filled while a request runs if a similar text was rewritten recently
+    similar_frame = tk.Frame(rewrite_header, bg="#f5f5f5")
+    similar_frame.pack(side=tk.LEFT, padx=5)
+    
     alternative_frame = tk.Frame(rewrite_header, bg="#f5f5f5")
-    radio_var = tk.IntVar(value=0)
+    radio_var = tk.IntVar(popup, value=0)
     alternative_frame.pack(side=tk.RIGHT)
     
-    rewritten_box = scrolledtext.ScrolledText(content_frame, height=20, font=("Arial", 10),
-                                            wrap=tk.WORD, bg="white", relief="solid", bd=1)
-    rewritten_box.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+    def make_rewritten_box(parent):
+        box = scrolledtext.ScrolledText(parent, height=20, font=("Arial", 10),
+                                        wrap=tk.WORD, bg="white", relief="solid", bd=1)
+        box.tag_configure(DIFF_TAGS[INSERT], background="#d5f5e3")
+        box.tag_configure(DIFF_TAGS[REPLACE], background="#fdebd0")
+        box.tag_configure(DIFF_TAGS[DELETE], foreground="#c0392b", overstrike=True)
+        return box
+    
+    # One box per alternative plus one for streamed text, stacked in the same place
+    rewrite_stack = tk.Frame(content_frame, bg="#f5f5f5")
+    rewrite_stack.pack(fill=tk.BOTH, expand=True, pady=(0, 10))
+    views = AlternativeViews(rewrite_stack, make_rewritten_box)
+    rewritten_box = views.box("stream")
+    views.show("stream")
 
     # Buttons are now created above in the proper order
 
-    start_rewrite()
-    popup.mainloop()
\ No newline at end of file
+    # Lay everything out now so the first show only has to map the window
+    popup.update_idletasks()
+
+    def show(original, trace=NULL_TRACE, on_close=None):
+        global alternatives, selected_alternative
+        reset_started = time.perf_counter()
+        if popup.winfo_viewable():
+            # Still open from the previous hotkey; end that session first
+            hide()
+        session.update(original=original, trace=trace, on_close=on_close, last_tone=None,
+                       prefetcher=Prefetcher(), diffs={}, on_screen=None)
+
+        settings = get_settings()
+        update_model_settings(settings)
+        model_var.set(settings.get('model', 'llama-4-scout'))
+        tone_dropdown.current(0)
+        custom_tone_entry.delete(0, tk.END)
+        custom_tone_entry.insert(0, placeholder_text)
+        custom_tone_entry.config(fg='gray')
+
+        alternatives = []
+        selected_alternative = 0
+        radio_var.set(0)
+        for widget in alternative_frame.winfo_children():
+            widget.destroy()
+        loading_label.config(text="Ready to rewrite", fg="#666666")
+        copy_button.config(state='disabled')
+
+        # Calculate height based on text length - keep original text compact
+        orig_lines = original.count('\n') + 1 + (len(original) // 80)  # Estimate wrapped lines
+        orig_height = max(2, min(4, orig_lines))  # Between 2-4 lines
+        if session["original_insert"] is not None:
+            session["original_insert"].cancel()
+        original_box.config(state='normal', height=orig_height)
+        original_box.delete("1.0", tk.END)
+        # Large selections go in over a few ticks; the box turns read-only once they are in
+        session["original_insert"] = IncrementalInsert(original_box, [(original, ())],
+                                                       on_done=lambda: original_box.config(state='disabled'))
+        views.clear()
+        views.show("stream")
+
+        # Ensure window appears on top and not minimized
+        popup.deiconify()
+        popup.lift()
+        popup.attributes('-topmost', True)
+        popup.after(100, lambda: popup.attributes('-topmost', False))
+        popup.focus_force()
+        popup.update_idletasks()
+        trace.record("window", time.perf_counter() - reset_started)
+        trace.mark("hotkey")
+
+        start_rewrite()
+
+    return show
+
+class PopupApp:
+    """Long-lived hidden Tk root on its own thread, owning the prebuilt popup.
+
+    Other threads hand work to the UI thread with post(), which goes through
+    the UI channel; show() opens the popup for newly captured text.
+    """
+
+    def __init__(self):
+        self.root = None
+        self._show = None
+        self._channel = get_ui_channel()
+        self._ready = threading.Event()
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        """Start the UI thread and build the popup; returns once it is ready, raising if building it failed"""
+        self._thread = threading.Thread(target=self._run, name="lexia-ui", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        try:
+            self.root = tk.Tk()
+            self.root.withdraw()
+            self._show = build_popup(self.root)
+            self._channel.attach(self.root)
+        except Exception as e:
+            self._error = e
+            if self.root is not None:
+                self.root.destroy()
+                self.root = None
+            return
+        finally:
+            # start() must never be left waiting
+            self._ready.set()
+        self.root.mainloop()
+
+    def post(self, callback, *args):
+        """Run callback(*args) on the UI thread"""
+        self._channel.post(callback, *args)
+
+    def show(self, original, trace=NULL_TRACE, on_close=None):
+        """Open the popup for newly captured text; on_close runs on the UI thread when it is dismissed"""
+        self.post(self._show, original, trace, on_close)
@@ -0,0 +1,217 @@
+"""
+Word-level diff for Lexia
+
+Diffs the original text against a rewrite on word and punctuation tokens, for
+highlighting what each alternative changed. The diff is a patience diff:
+common prefixes/suffixes are trimmed, tokens that occur exactly once on both
+sides anchor the alignment (longest increasing subsequence), and the gaps
+between anchors are diffed recursively, falling back to a bounded Myers
+diff. That stays close to linear on the long, heavily reworded texts a
+rewrite produces, where difflib's SequenceMatcher goes quadratic.
+
+Diffs run on a worker thread (submit_diff) so the popup never computes one
+on the Tk thread; results are memoized per (original, rewrite) pair.
+"""
+
+import bisect
+import concurrent.futures
+import functools
+import re
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+# Gaps without unique anchors are Myers-diffed only when small; beyond that
+# they are reported as a replacement rather than stalling the worker
+MYERS_MAX_TOKENS = 4000
+MYERS_MAX_EDITS = 200
+
+# Segment tags
+INSERT = "insert"
+DELETE = "delete"
+REPLACE = "replace"
+
+def tokenize(text):
+    """Get the word/punctuation tokens of text and their (start, end) spans"""
+    spans = [match.span() for match in _TOKEN_RE.finditer(text)]
+    return [text[start:end] for start, end in spans], spans
+
+def _longest_increasing(pairs):
+    """Longest subsequence of (i, j) pairs, already sorted by i, with increasing j"""
+    tails = []
+    tail_indexes = []
+    previous = [None] * len(pairs)
+    for index, (_, j) in enumerate(pairs):
+        position = bisect.bisect_left(tails, j)
+        if position:
+            previous[index] = tail_indexes[position - 1]
+        if position == len(tails):
+            tails.append(j)
+            tail_indexes.append(index)
+        else:
+            tails[position] = j
+            tail_indexes[position] = index
+    result = []
+    index = tail_indexes[-1] if tail_indexes else None
+    while index is not None:
+        result.append(pairs[index])
+        index = previous[index]
+    result.reverse()
+    return result
+
+def _unique_anchors(a, b, alo, ahi, blo, bhi):
+    counts = {}
+    for i in range(alo, ahi):
+        entry = counts.get(a[i])
+        counts[a[i]] = [i, None, 0] if entry is None else [entry[0], None, 2]
+    for j in range(blo, bhi):
+        entry = counts.get(b[j])
+        if entry is not None and entry[2] != 2:
+            if entry[1] is None:
+                entry[1] = j
+            else:
+                entry[2] = 2
+    pairs = sorted((i, j) for i, j, repeated in counts.values() if j is not None and not repeated)
+    return _longest_increasing(pairs)
+
+def _myers(a, b, alo, ahi, blo, bhi):
+    """Matched (i, j) pairs of a shortest edit script, or None if it needs more than MYERS_MAX_EDITS edits"""
+    n, m = ahi - alo, bhi - blo
+    max_edits = min(n + m, MYERS_MAX_EDITS)
+    offset = max_edits + 1
+    v = [0] * (2 * max_edits + 3)
+    trace = []
+    for d in range(max_edits + 1):
+        trace.append(v[:])
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+                x = v[offset + k + 1]
+            else:
+                x = v[offset + k - 1] + 1
+            y = x - k
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            v[offset + k] = x
+            if x >= n and y >= m:
+                return _myers_backtrack(trace, offset, n, m, alo, blo)
+    return None
+
+def _myers_backtrack(trace, offset, x, y, alo, blo):
+    matches = []
+    for d in range(len(trace) - 1, -1, -1):
+        v = trace[d]
+        k = x - y
+        if k == -d or (k != d and v[offset + k - 1] < v[offset + k + 1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = v[offset + previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            x -= 1
+            y -= 1
+            matches.append((alo + x, blo + y))
+        x, y = previous_x, previous_y
+    matches.reverse()
+    return matches
+
+def _match(a, b, alo, ahi, blo, bhi, matches):
+    """Append the matched (i, j) pairs between a[alo:ahi] and b[blo:bhi] to matches, in order"""
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        matches.append((alo, blo))
+        alo += 1
+        blo += 1
+    suffix_length = 0
+    while alo < ahi - suffix_length and blo < bhi - suffix_length and a[ahi - suffix_length - 1] == b[bhi - suffix_length - 1]:
+        suffix_length += 1
+    ahi -= suffix_length
+    bhi -= suffix_length
+
+    if alo < ahi and blo < bhi:
+        anchors = _unique_anchors(a, b, alo, ahi, blo, bhi)
+        if anchors:
+            gap_a, gap_b = alo, blo
+            for i, j in anchors:
+                _match(a, b, gap_a, i, gap_b, j, matches)
+                matches.append((i, j))
+                gap_a, gap_b = i + 1, j + 1
+            _match(a, b, gap_a, ahi, gap_b, bhi, matches)
+        elif (ahi - alo) + (bhi - blo) <= MYERS_MAX_TOKENS:
+            matches.extend(_myers(a, b, alo, ahi, blo, bhi) or [])
+
+    matches.extend((ahi + offset, bhi + offset) for offset in range(suffix_length))
+
+def diff_tokens(a, b):
+    """Get difflib-style opcodes (tag, i1, i2, j1, j2) turning token list a into b"""
+    matches = []
+    _match(a, b, 0, len(a), 0, len(b), matches)
+    matches.append((len(a), len(b)))
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches:
+        if i < match_i and j < match_j:
+            opcodes.append((REPLACE, i, match_i, j, match_j))
+        elif i < match_i:
+            opcodes.append((DELETE, i, match_i, j, j))
+        elif j < match_j:
+            opcodes.append((INSERT, i, i, j, match_j))
+        if match_i < len(a):
+            if opcodes and opcodes[-1][0] == "equal":
+                tag, i1, _, j1, _ = opcodes.pop()
+                opcodes.append((tag, i1, match_i + 1, j1, match_j + 1))
+            else:
+                opcodes.append(("equal", match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    return opcodes
+
+@functools.lru_cache(maxsize=64)
+def diff_segments(original, rewritten):
+    """Get the rewrite as (text, tag) segments, with the original's deleted words spliced in.
+
+    Untagged, INSERT and REPLACE segments together are exactly rewritten;
+    DELETE segments hold removed text (with a separating space) to show
+    struck through and to leave out when copying.
+    """
+    a_tokens, a_spans = tokenize(original)
+    b_tokens, b_spans = tokenize(rewritten)
+    segments = []
+    position = 0
+
+    def emit(text, tag=None):
+        if not text:
+            return
+        if segments and segments[-1][1] == tag:
+            segments[-1] = (segments[-1][0] + text, tag)
+        else:
+            segments.append((text, tag))
+
+    for tag, i1, i2, j1, j2 in diff_tokens(a_tokens, b_tokens):
+        if tag in (DELETE, REPLACE):
+            deleted = original[a_spans[i1][0]:a_spans[i2 - 1][1]]
+            if j1 < len(b_spans):
+                # Keep the deletion after the whitespace, next to the word it precedes
+                emit(rewritten[position:b_spans[j1][0]])
+                position = b_spans[j1][0]
+                emit(deleted + " ", DELETE)
+            else:
+                emit(rewritten[position:])
+                position = len(rewritten)
+                emit(" " + deleted, DELETE)
+        if tag == "equal":
+            emit(rewritten[position:b_spans[j2 - 1][1]])
+            position = b_spans[j2 - 1][1]
+        elif tag in (INSERT, REPLACE):
+            emit(rewritten[position:b_spans[j1][0]])
+            emit(rewritten[b_spans[j1][0]:b_spans[j2 - 1][1]], tag)
+            position = b_spans[j2 - 1][1]
+    emit(rewritten[position:])
+    return tuple(segments)
+
+_executor = None
+
+def submit_diff(original, rewritten):
+    """Compute diff_segments on the diff worker thread; returns a Future"""
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="lexia-diff")
+    return _executor.submit(diff_segments, original, rewritten)